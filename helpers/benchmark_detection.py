@@ -0,0 +1,136 @@
+import argparse
+import statistics
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers.food_detection import load_model, list_images, backend_model_path, get_model, detect, decode_image, predict, INFERENCE_TIERS
+
+def detect_classes(model, image_path):
+    """Runs one inference and returns (latency in ms, set of detected classes)."""
+    start = time.perf_counter()
+    result = model.predict(image_path, verbose=False)[0]
+    latency = (time.perf_counter() - start) * 1000
+    return latency, {result.names[int(label)] for label in result.boxes.cls}
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+def benchmark(backends, image_paths, repeats=3):
+    """
+    Measures the latency of each backend on the images and the agreement of its
+    detected classes with the first backend (the reference).
+    """
+    reports = []
+    reference = None
+    for backend, int8 in backends:
+        model = load_model(backend, int8)
+        latencies = []
+        classes = []
+        for image_path in image_paths:
+            runs = [detect_classes(model, image_path) for _ in range(repeats)]
+            latencies.append(min(latency for latency, _ in runs))
+            classes.append(runs[0][1])
+        if reference is None:
+            reference = classes
+        reports.append({
+            "backend": backend + (" int8" if int8 else ""),
+            "median_ms": statistics.median(latencies),
+            "mean_ms": statistics.mean(latencies),
+            "exact_agreement": sum(c == r for c, r in zip(classes, reference)) / len(classes),
+            "mean_jaccard": statistics.mean(jaccard(c, r) for c, r in zip(classes, reference)),
+        })
+    return reports
+
+def benchmark_tiers(image_paths, modes=("fast", "balanced", "accurate", "auto")):
+    """
+    Measures the latency of each inference tier with the configured backend, and its
+    recall: the share of the classes found by the "accurate" tier that it also finds.
+    """
+    get_model()
+    images = [decode_image(image_path) for image_path in image_paths]
+    reference = None
+    reports = []
+    for mode in ["accurate"] + [mode for mode in modes if mode != "accurate"]:
+        latencies = []
+        classes = []
+        tiers_used = []
+        for image in images:
+            start = time.perf_counter()
+            results, tier = detect(image, mode)
+            latencies.append((time.perf_counter() - start) * 1000)
+            classes.append({results[0].names[int(label)] for label in results[0].boxes.cls})
+            tiers_used.append(tier)
+        if reference is None:
+            reference = classes
+        found = sum(len(c & r) for c, r in zip(classes, reference))
+        expected = sum(len(r) for r in reference)
+        reports.append({
+            "mode": mode,
+            "median_ms": statistics.median(latencies),
+            "mean_ms": statistics.mean(latencies),
+            "recall": found / expected if expected else 1.0,
+            "tiers_used": {tier: tiers_used.count(tier) for tier in INFERENCE_TIERS if tier in tiers_used},
+        })
+    return [report for mode in modes for report in reports if report["mode"] == mode]
+
+def benchmark_batch(image_paths, batch_sizes=(1, 4, 8), repeats=3):
+    """
+    Measures the throughput of the batched folder path (analyse_frigo_batch) for each batch
+    size, batch size 1 being the single-image path, with the configured backend.
+    """
+    get_model()
+    reports = []
+    for batch_size in batch_sizes:
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for i in range(0, len(image_paths), batch_size):
+                batch = image_paths[i:i + batch_size]
+                predict(batch, batch=len(batch))
+            runs.append(time.perf_counter() - start)
+        seconds = min(runs)
+        reports.append({"batch_size": batch_size, "seconds": seconds, "images_per_sec": len(image_paths) / seconds})
+    for report in reports:
+        report["speedup"] = report["images_per_sec"] / reports[0]["images_per_sec"]
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the latency and detected classes of the detection backends or inference tiers.")
+    parser.add_argument("input_folder", nargs="?", default=os.path.join("data", "fridge_images", "input"))
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "onnx", "openvino"],
+                        help="backends to compare, the first one is the reference; add ':int8' for quantized models")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--tiers", action="store_true", help="compare the inference tiers instead of the backends")
+    parser.add_argument("--batch-sizes", nargs="+", type=int,
+                        help="compare the throughput of these batch sizes instead of the backends (the first one is the reference)")
+    args = parser.parse_args()
+    image_paths = list_images(args.input_folder)
+
+    if args.batch_sizes:
+        print(f"{'batch size':<12}{'seconds':>10}{'images/sec':>12}{'speedup':>9}")
+        for report in benchmark_batch(image_paths, args.batch_sizes, args.repeats):
+            print(f"{report['batch_size']:<12}{report['seconds']:>10.2f}{report['images_per_sec']:>12.2f}{report['speedup']:>8.2f}x")
+        sys.exit()
+
+    if args.tiers:
+        print(f"{'mode':<12}{'median ms':>12}{'mean ms':>12}{'recall':>9}  tiers used")
+        for report in benchmark_tiers(image_paths):
+            print(f"{report['mode']:<12}{report['median_ms']:>12.1f}{report['mean_ms']:>12.1f}"
+                  f"{report['recall']:>9.0%}  {report['tiers_used']}")
+        sys.exit()
+
+    backends = []
+    for name in args.backends:
+        backend, _, variant = name.partition(":")
+        int8 = variant == "int8"
+        if os.path.exists(backend_model_path(backend, int8)):
+            backends.append((backend, int8))
+        else:
+            print(f"Skipping {name}: {backend_model_path(backend, int8)} not found (see food_detection.export_model)")
+
+    print(f"{'backend':<16}{'median ms':>12}{'mean ms':>12}{'same classes':>14}{'jaccard':>10}")
+    for report in benchmark(backends, image_paths, args.repeats):
+        print(f"{report['backend']:<16}{report['median_ms']:>12.1f}{report['mean_ms']:>12.1f}"
+              f"{report['exact_agreement']:>14.0%}{report['mean_jaccard']:>10.2f}")
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PAGES = ["dashboard", "alimentation", "informations", "chat"]
+
+# Runs in a fresh interpreter, so that every measure is a cold start.
+# Streamlit itself is imported before the timer starts: we measure the app, not the framework.
+LOGIN_SCRIPT = """
+import json, time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file({main!r}, default_timeout=600).run()
+print(json.dumps({{"seconds": time.perf_counter() - start, "errors": [str(e.value) for e in app.exception]}}))
+"""
+
+PAGE_SCRIPT = """
+import json, time
+from streamlit.testing.v1 import AppTest
+
+def page():
+    import sys
+    import streamlit as st
+    sys.path.insert(0, {pages_dir!r})
+    st.session_state["authenticated"] = True
+    st.session_state["user"] = {user!r}
+    import {page}
+    {page}.show()
+
+start = time.perf_counter()
+app = AppTest.from_function(page, default_timeout=600).run()
+print(json.dumps({{"seconds": time.perf_counter() - start, "errors": [str(e.value) for e in app.exception]}}))
+"""
+
+def run_measure(script):
+    # Without the Garmin sync scheduler, which the app would otherwise start in each measured process
+    env = {**os.environ, "SYNC_SCHEDULER": "0"}
+    output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def time_to_login_screen():
+    """Seconds from running pages/main.py to the rendered login screen (cold process)."""
+    return run_measure(LOGIN_SCRIPT.format(main=os.path.join(ROOT, "pages", "main.py")))
+
+def page_first_render(page, user):
+    """Seconds to import and render a page for the first time in a cold process, logged in as user."""
+    return run_measure(PAGE_SCRIPT.format(pages_dir=os.path.join(ROOT, "pages"), user=user, page=page))
+
+def default_user():
+    conn = sqlite3.connect(os.path.join(ROOT, "data", "users.db"))
+    row = conn.execute("SELECT username FROM users ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    return row[0] if row else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the time to the login screen and the first render of each page.")
+    parser.add_argument("--user", default=None, help="username used to render the pages (default: first user)")
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    args = parser.parse_args()
+    user = args.user or default_user()
+
+    results = [("login screen", time_to_login_screen())]
+    results += [(page, page_first_render(page, user)) for page in args.pages]
+
+    print(f"{'target':<16}{'seconds':>10}  errors")
+    for name, result in results:
+        print(f"{name:<16}{result['seconds']:>10.2f}  {'; '.join(result['errors'])}")
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers import chunked_pipeline, ingredients, nutriscore, recipe_catalog, score_analysis
+
+# Hashes of the inputs, parameters and outputs of the last build of each stage, and its timing
+STATE_FILE = "data/build_state.json"
+
+# Data flow: RAW_recipes.csv -> nutriscore -> processed_recipes.csv -> ingredients
+# -> processed_recipes_with_categories.csv -> catalog, and processed_recipes.csv -> score_analysis.
+# A stage is rebuilt when the content of its inputs, its code, its params or its options change.
+# "streamable" stages accept the stream/max_memory_mb/workers options. They are part of the stage key:
+# the chunk boundaries can change the output (e.g. the column types pandas infers per chunk).
+STAGES = [
+    {
+        "name": "nutriscore",
+        "inputs": [nutriscore.file_path],
+        "outputs": [nutriscore.output_file],
+        "code": [nutriscore.__file__, chunked_pipeline.__file__],
+        "params": {"daily_values": nutriscore.daily_values},
+        "streamable": True,
+        "run": lambda inputs, outputs, **options: nutriscore.process_recipes(inputs[0], outputs[0], **options),
+    },
+    {
+        "name": "ingredients",
+        "inputs": [nutriscore.output_file],
+        "outputs": [ingredients.output_file],
+        "code": [ingredients.__file__, chunked_pipeline.__file__],
+        "params": {"categories": ingredients.ingredients_categories, "threshold": ingredients.MATCH_THRESHOLD,
+                   "scorer": ingredients.MATCH_SCORER},
+        "streamable": True,
+        "run": lambda inputs, outputs, **options: ingredients.process_ingredients(inputs[0], outputs[0], **options),
+    },
+    {
+        "name": "score_analysis",
+        "inputs": [nutriscore.output_file],
+        "outputs": [score_analysis.analysis_file],
+        "code": [score_analysis.__file__],
+        "params": {},
+        "streamable": False,
+        "run": lambda inputs, outputs: score_analysis.analyse_nutriscores(inputs[0], outputs[0]),
+    },
+    {
+        "name": "catalog",
+        "inputs": [ingredients.output_file],
+        "outputs": [recipe_catalog.CATALOG_FILE],
+        "code": [recipe_catalog.__file__],
+        "params": {"columns": recipe_catalog.CATALOG_COLUMNS, "patterns": recipe_catalog.CATEGORY_PATTERNS},
+        "streamable": False,
+        "run": lambda inputs, outputs: recipe_catalog.build_catalog(inputs[0], outputs[0]),
+    },
+]
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"files": {}, "stages": {}}
+
+def save_state(state, path=STATE_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def file_hash(path, state):
+    """
+    SHA-256 of a file's content. The hash is reused from the state while the
+    file's size and modification time are unchanged, so big CSVs are not re-read.
+    """
+    stat = os.stat(path)
+    cached = state["files"].get(path)
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    state["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return digest.hexdigest()
+
+def stage_options(stage, options):
+    """
+    Options passed to a stage, with their defaults. max_memory_mb and workers
+    only matter in streaming mode, so they are dropped otherwise.
+    """
+    if not stage["streamable"]:
+        return {}
+    options = {"stream": False, "max_memory_mb": chunked_pipeline.DEFAULT_MAX_MEMORY_MB, "workers": None, **options}
+    return options if options["stream"] else {"stream": False}
+
+def stage_key(stage, state, options=None):
+    """Content address of a stage: hash of its input files, code files, params and options."""
+    key = {
+        "inputs": {path: file_hash(path, state) for path in stage["inputs"]},
+        "code": {os.path.basename(path): file_hash(path, state) for path in stage["code"]},
+        "params": stage["params"],
+        "options": options or {},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def is_up_to_date(stage, key, state):
+    previous = state["stages"].get(stage["name"])
+    if not previous or previous["key"] != key:
+        return False
+    return all(os.path.exists(path) and file_hash(path, state) == previous["outputs"].get(path)
+               for path in stage["outputs"])
+
+def building_path(path):
+    """Temporary output path, keeping the extension so that the writers behave the same."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.building{ext}"
+
+def run_build(stage_names=None, force=False, **options):
+    """
+    Runs the stages in order, skipping those whose inputs, code, params and options are unchanged.
+    Outputs are written to temporary files and renamed only when the stage succeeds.
+    Returns a list of (stage name, "built" or "skipped", seconds).
+    """
+    state = load_state()
+    report = []
+    for stage in STAGES:
+        if stage_names and stage["name"] not in stage_names:
+            continue
+        missing = [path for path in stage["inputs"] if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f"Stage {stage['name']}: missing input(s) {', '.join(missing)}")
+
+        stage_opts = stage_options(stage, options)
+        key = stage_key(stage, state, stage_opts)
+        if not force and is_up_to_date(stage, key, state):
+            report.append((stage["name"], "skipped", 0.0))
+            continue
+
+        tmp_outputs = [building_path(path) for path in stage["outputs"]]
+        start = time.perf_counter()
+        try:
+            stage["run"](stage["inputs"], tmp_outputs, **stage_opts)
+        except BaseException:
+            for tmp_path in tmp_outputs:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+        for tmp_path, path in zip(tmp_outputs, stage["outputs"]):
+            os.replace(tmp_path, path)
+        seconds = time.perf_counter() - start
+
+        state["stages"][stage["name"]] = {
+            "key": key,
+            "outputs": {path: file_hash(path, state) for path in stage["outputs"]},
+            "seconds": round(seconds, 3),
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        save_state(state)
+        report.append((stage["name"], "built", seconds))
+    save_state(state)
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Rebuild the recipe data artifacts whose inputs changed.")
+    parser.add_argument("stages", nargs="*", help="stages to run (default: all): " + ", ".join(s["name"] for s in STAGES))
+    parser.add_argument("--force", action="store_true", help="rebuild even if the inputs are unchanged")
+    parser.add_argument("--stream", action="store_true", help="process the CSVs in chunks with bounded memory")
+    parser.add_argument("--max-memory-mb", type=int, default=chunked_pipeline.DEFAULT_MAX_MEMORY_MB)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    report = run_build(args.stages, args.force, stream=args.stream, max_memory_mb=args.max_memory_mb, workers=args.workers)
+    print(f"\n{'stage':<16}{'status':<10}{'seconds':>10}")
+    for name, status, seconds in report:
+        print(f"{name:<16}{status:<10}{seconds:>10.2f}")
+    print(f"{'total':<26}{sum(seconds for _, _, seconds in report):>10.2f}")
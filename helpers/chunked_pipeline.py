@@ -0,0 +1,110 @@
+import csv
+import heapq
+import math
+import os
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Default memory budget of the streaming mode, in MB
+DEFAULT_MAX_MEMORY_MB = 512
+
+def estimate_chunksize(input_path, max_memory_mb, workers, sample_rows=1000):
+    """
+    Number of rows per chunk so that the chunks in flight (one being read, two per
+    worker being processed or waiting) stay within max_memory_mb.
+    Processing roughly doubles the size of a chunk, hence the factor 2.
+    """
+    sample = pd.read_csv(input_path, nrows=sample_rows)
+    bytes_per_row = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+    chunks_in_memory = 2 * workers + 1
+    return max(int(max_memory_mb * 1024 ** 2 / (2 * bytes_per_row * chunks_in_memory)), 100)
+
+def map_chunks(input_path, process_chunk, chunksize, workers):
+    """
+    Reads the CSV in chunks and yields process_chunk(chunk) in input order,
+    processing up to 2 * workers chunks at a time in a process pool.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in pd.read_csv(input_path, chunksize=chunksize):
+            pending.append(executor.submit(process_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _sort_key(value):
+    """Merge key of a CSV value: numbers ascending, missing values last (as sort_values)."""
+    try:
+        number = float(value)
+    except ValueError:
+        return (1, 0.0)
+    return (1, 0.0) if math.isnan(number) else (0, number)
+
+def merge_sorted_runs(run_paths, output_path, sort_by):
+    """
+    k-way merge of CSV files already sorted by the sort_by columns, holding one row per file
+    in memory. Rows with equal keys keep the order of the runs (stable, as sort_values(kind="stable")).
+    """
+    csv.field_size_limit(sys.maxsize)
+    files = [open(path, newline="") for path in run_paths]
+    try:
+        readers = [csv.reader(f) for f in files]
+        header = None
+        for reader in readers:
+            header = next(reader)
+        columns = [header.index(column) for column in sort_by]
+
+        def keyed_rows(run_index, reader):
+            for row in reader:
+                yield tuple(_sort_key(row[column]) for column in columns), run_index, row
+
+        with open(output_path, "w", newline="") as out:
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(header)
+            for _, _, row in heapq.merge(*(keyed_rows(i, reader) for i, reader in enumerate(readers))):
+                writer.writerow(row)
+    finally:
+        for f in files:
+            f.close()
+
+def process_csv_in_chunks(input_path, output_path, process_chunk, sort_by=None,
+                          max_memory_mb=DEFAULT_MAX_MEMORY_MB, workers=None, chunksize=None):
+    """
+    Streaming version of read_csv -> process_chunk -> (sort_values) -> to_csv with bounded memory.
+    Chunks are processed in a process pool across all cores and written incrementally.
+    With sort_by (a column or a list of columns), each processed chunk is written as a
+    sorted run and the runs are combined with an external merge. Returns the number of rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or estimate_chunksize(input_path, max_memory_mb, workers)
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    tmp_path = output_path + ".tmp"
+    rows = 0
+
+    if sort_by is None:
+        with open(tmp_path, "w", newline="") as out:
+            for i, chunk in enumerate(map_chunks(input_path, process_chunk, chunksize, workers)):
+                chunk.to_csv(out, index=False, header=(i == 0))
+                rows += len(chunk)
+        os.replace(tmp_path, output_path)
+        return rows
+
+    sort_by = [sort_by] if isinstance(sort_by, str) else list(sort_by)
+    with tempfile.TemporaryDirectory(dir=output_dir) as run_dir:
+        run_paths = []
+        for i, chunk in enumerate(map_chunks(input_path, process_chunk, chunksize, workers)):
+            run_path = os.path.join(run_dir, f"run_{i:05d}.csv")
+            chunk.sort_values(by=sort_by, ascending=True, kind="stable").to_csv(run_path, index=False)
+            run_paths.append(run_path)
+            rows += len(chunk)
+        if run_paths:
+            merge_sorted_runs(run_paths, tmp_path, sort_by)
+        else:
+            open(tmp_path, "w").close()
+    os.replace(tmp_path, output_path)
+    return rows
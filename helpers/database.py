@@ -2,203 +2,499 @@ import sqlite3
 import bcrypt
 from datetime import date
 import json
-from garminconnect import Garmin
 import datetime
+import threading
+import weakref
+from contextlib import contextmanager
 
 
 DB_FILE = "data/users.db"
 
-def init_db():
-    """Crée les tables users et activities si elles n'existent pas"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+# Attente maximale (en secondes) quand la base est verrouillée par un autre écrivain
+BUSY_TIMEOUT = 5.0
+# Pragmas appliqués à chaque nouvelle connexion :
+# WAL pour que les lectures ne bloquent pas les écritures (et inversement),
+# synchronous=NORMAL (sûr en WAL), 16 Mo de cache de pages, tables temporaires en mémoire
+CONNECTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+}
 
-    # supprime garmin_id et garmin_password du user 1
-    cursor.execute("""
-    UPDATE users
-    SET weight = 70, birth_date = '2001-06-08'
-    WHERE id = 1
-    """)
+# Chaque thread utilise sa propre connexion. Streamlit exécute chaque rerun d'une page dans
+# un nouveau thread (ScriptRunner) : à la fin d'un thread, sa connexion est rendue au pool
+# des connexions libres, reprises par les threads suivants, ou fermée si le pool est plein
+_local = threading.local()
+# Nombre maximal de connexions libres gardées ouvertes
+POOL_SIZE = 8
+_pool = []
+_pool_lock = threading.Lock()
 
-    # detele table activities
-    # cursor.execute("""
-    # DROP TABLE IF EXISTS activities
-    # """)
+# Version des données de chaque utilisateur dans ce processus, incrémentée après chaque
+# écriture qui le concerne : un cache (ex. l'instantané du tableau de bord) reste valide
+# tant que la version n'a pas changé, sans requête pour le vérifier
+_data_versions = {}
+_data_versions_lock = threading.Lock()
 
+def _release(conn, db_file):
+    """Rend une connexion au pool des connexions libres, ou la ferme si le pool est plein"""
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        if db_file == DB_FILE and len(_pool) < POOL_SIZE:
+            _pool.append((conn, db_file))
+            return
+    conn.close()
 
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        birth_date TEXT,
-        weight REAL,
-        height REAL,
-        gender TEXT CHECK(gender IN ('M', 'F')),
-        garmin_id TEXT DEFAULT NULL,
-        garmin_password TEXT DEFAULT NULL
-    )
-    """)
+class _Lease:
+    """Connexion prêtée au thread courant ; rendue au pool quand le thread se termine"""
 
+    def __init__(self, conn, db_file):
+        self.conn, self.db_file = conn, db_file
+        self.release = weakref.finalize(self, _release, conn, db_file)
+
+def get_connection():
+    """
+    Renvoie la connexion SQLite du thread courant : une connexion libre du pool,
+    ou une nouvelle connexion, gardée par le thread jusqu'à sa fin.
+    La connexion est en mode autocommit : les écritures passent par transaction().
+    """
+    lease = getattr(_local, "lease", None)
+    if lease is not None and lease.db_file == DB_FILE:
+        return lease.conn
+    if lease is not None:
+        lease.release()
+    with _pool_lock:
+        # Connexions d'une autre base (DB_FILE changé) : fermées plutôt que reprises
+        stale = [conn for conn, db_file in _pool if db_file != DB_FILE]
+        _pool[:] = [(conn, db_file) for conn, db_file in _pool if db_file == DB_FILE]
+        conn = _pool.pop()[0] if _pool else None
+    for stale_conn in stale:
+        stale_conn.close()
+    if conn is None:
+        # check_same_thread=False : la connexion passe d'un thread à l'autre par le pool,
+        # jamais utilisée par deux threads à la fois
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        for pragma, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+    _local.lease = _Lease(conn, DB_FILE)
+    return conn
+
+def close_connection():
+    """Ferme la connexion du thread courant (une autre sera prise au prochain appel)"""
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        lease.release.detach()
+        lease.conn.close()
+        _local.lease = None
+
+@contextmanager
+def transaction(immediate=True):
+    """
+    Ouvre une transaction sur la connexion du thread : commit à la sortie, rollback en cas d'exception.
+    BEGIN IMMEDIATE prend le verrou d'écriture dès le début (pas d'échec lors de l'escalade
+    lecture -> écriture) ; immediate=False pour une transaction de lecture cohérente.
+    Une transaction imbriquée fait partie de la transaction englobante.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    _local.after_commit = []
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        _local.after_commit = []
+        raise
+    conn.commit()
+    callbacks, _local.after_commit = _local.after_commit, []
+    for callback in callbacks:
+        callback()
+
+def on_commit(callback):
+    """Appelle callback après le commit de la transaction en cours (tout de suite hors transaction)"""
+    if get_connection().in_transaction:
+        _local.after_commit.append(callback)
+    else:
+        callback()
+
+def get_data_version(user_id):
+    """Version des données d'un utilisateur (sans requête)"""
+    with _data_versions_lock:
+        return _data_versions.get(user_id, 0)
+
+def bump_data_version(user_id):
+    """Signale que les données d'un utilisateur ont changé, une fois la transaction validée"""
+    def bump():
+        with _data_versions_lock:
+            _data_versions[user_id] = _data_versions.get(user_id, 0) + 1
+    on_commit(bump)
+
+def query(sql, params=()):
+    """Exécute une requête de lecture sur la connexion du thread et renvoie toutes les lignes"""
+    return get_connection().execute(sql, params).fetchall()
+
+# Colonnes de la table de synthèse journalière daily_user_stats (après user_id et day)
+DAILY_STATS_COLUMNS = [
+    "calories_burned", "steps", "calories_eaten",
+    "total_fat_PDV", "sugar_PDV", "sodium_PDV", "protein_PDV", "saturated_fat_PDV", "carbohydrates_PDV",
+    "weight",
+]
+
+# Recalcule la ligne d'un jour d'un utilisateur à partir des tables sources (recherches par index).
+# Un jour sans aucune donnée n'a pas de ligne (comme dans _fill_daily_stats).
+REFRESH_DAILY_STATS = f"""
+INSERT OR REPLACE INTO daily_user_stats (user_id, day, {', '.join(DAILY_STATS_COLUMNS)})
+SELECT :user_id, :day, a.calories_burned, a.steps, p.calories_eaten,
+       p.total_fat_PDV, p.sugar_PDV, p.sodium_PDV, p.protein_PDV, p.saturated_fat_PDV, p.carbohydrates_PDV,
+       w.weight
+FROM (SELECT COUNT(*) AS n, SUM(calories) AS calories_burned, SUM(steps) AS steps
+      FROM activities WHERE user_id = :user_id AND start_date = :day) AS a,
+     (SELECT COUNT(*) AS n, SUM(calories) AS calories_eaten, SUM(total_fat_PDV) AS total_fat_PDV,
+             SUM(sugar_PDV) AS sugar_PDV, SUM(sodium_PDV) AS sodium_PDV, SUM(protein_PDV) AS protein_PDV,
+             SUM(saturated_fat_PDV) AS saturated_fat_PDV, SUM(carbohydrates_PDV) AS carbohydrates_PDV
+      FROM pdv WHERE user_id = :user_id AND date = :day) AS p,
+     (SELECT COUNT(*) AS n, (SELECT poid FROM poids WHERE user_id = :user_id AND date = :day ORDER BY id DESC LIMIT 1) AS weight
+      FROM poids WHERE user_id = :user_id AND date = :day) AS w
+WHERE a.n + p.n + w.n > 0
+"""
+
+def refresh_daily_stats(cursor, user_id, days):
+    """Met à jour la synthèse journalière des jours donnés (après une écriture dans activities, pdv ou poids)"""
+    params = [{"user_id": user_id, "day": str(day)} for day in set(days) if day]
+    # La ligne d'un jour qui n'a plus de données (activité déplacée) est supprimée
+    cursor.executemany("DELETE FROM daily_user_stats WHERE user_id = :user_id AND day = :day", params)
+    cursor.executemany(REFRESH_DAILY_STATS, params)
+
+def _fill_daily_stats(cursor):
+    """Calcule la synthèse journalière de toutes les données existantes"""
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS activities (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        activity_name TEXT,
-        start_time TEXT,
-        calories REAL,
-        bmrCalories REAL,
-        steps INTEGER,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS poids (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        poid REAL,
-        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS pdv (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER,
-        calories REAL,
-        total_fat_PDV REAL,
-        sugar_PDV REAL,
-        sodium_PDV REAL,
-        protein_PDV REAL,
-        saturated_fat_PDV REAL,
-        carbohydrates_PDV REAL,
-        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
+    SELECT user_id, start_date FROM activities WHERE start_date IS NOT NULL
+    UNION SELECT user_id, date FROM pdv WHERE date IS NOT NULL
+    UNION SELECT user_id, date FROM poids WHERE date IS NOT NULL
     """)
+    cursor.executemany(REFRESH_DAILY_STATS, [{"user_id": user_id, "day": day} for user_id, day in cursor.fetchall()])
 
-    conn.commit()
-    conn.close()
+# Migrations du schéma, appliquées dans l'ordre et une seule fois : une base en version N
+# (PRAGMA user_version) a reçu les N premières migrations. Une migration déjà publiée
+# ne doit plus être modifiée, on en ajoute une nouvelle à la fin.
+# Chaque étape est une requête SQL ou une fonction qui reçoit le curseur.
+MIGRATIONS = [
+    # 1 : tables initiales
+    [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            birth_date TEXT,
+            weight REAL,
+            height REAL,
+            gender TEXT CHECK(gender IN ('M', 'F')),
+            garmin_id TEXT DEFAULT NULL,
+            garmin_password TEXT DEFAULT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS activities (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            activity_name TEXT,
+            start_time TEXT,
+            calories REAL,
+            bmrCalories REAL,
+            steps INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS poids (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            poid REAL,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS pdv (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            calories REAL,
+            total_fat_PDV REAL,
+            sugar_PDV REAL,
+            sodium_PDV REAL,
+            protein_PDV REAL,
+            saturated_fat_PDV REAL,
+            carbohydrates_PDV REAL,
+            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+    ],
+    # 2 : index par utilisateur et par date, dates au format 'YYYY-MM-DD'
+    [
+        # Jour de l'activité (colonne calculée) : les filtres par jour utilisent l'index
+        # au lieu d'appliquer DATE(start_time) à chaque ligne
+        "ALTER TABLE activities ADD COLUMN start_date TEXT GENERATED ALWAYS AS (DATE(start_time)) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_activities_user_start_time ON activities (user_id, start_time)",
+        "CREATE INDEX IF NOT EXISTS idx_activities_user_start_date ON activities (user_id, start_date)",
+        # Les valeurs par défaut (CURRENT_TIMESTAMP) contiennent l'heure : on ne garde que le jour,
+        # pour que les comparaisons et les intervalles de dates soient justes
+        "UPDATE poids SET date = DATE(date) WHERE DATE(date) IS NOT NULL AND date <> DATE(date)",
+        "UPDATE pdv SET date = DATE(date) WHERE DATE(date) IS NOT NULL AND date <> DATE(date)",
+        "CREATE INDEX IF NOT EXISTS idx_poids_user_date ON poids (user_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_pdv_user_date ON pdv (user_id, date)",
+    ],
+    # 3 : état de la synchronisation Garmin (session garth réutilisable, watermark)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS garmin_sync (
+            user_id INTEGER PRIMARY KEY,
+            garth_tokens TEXT,
+            last_start_time TEXT,
+            last_synced_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+    ],
+    # 4 : statut de la synchronisation en arrière-plan, lu par l'interface
+    [
+        "ALTER TABLE garmin_sync ADD COLUMN status TEXT",
+        "ALTER TABLE garmin_sync ADD COLUMN last_error TEXT",
+        "ALTER TABLE garmin_sync ADD COLUMN failures INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE garmin_sync ADD COLUMN started_at TEXT",
+        "ALTER TABLE garmin_sync ADD COLUMN next_sync_at TEXT",
+    ],
+    # 5 : import de l'historique Garmin, par intervalles de dates (reprise après interruption)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS garmin_backfill (
+            user_id INTEGER,
+            range_start TEXT,
+            range_end TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            activities INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            PRIMARY KEY (user_id, range_start),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        """,
+    ],
+    # 6 : synthèse journalière par utilisateur, tenue à jour par les fonctions d'écriture
+    [
+        f"""
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            user_id INTEGER,
+            day TEXT,
+            {' REAL, '.join(DAILY_STATS_COLUMNS)} REAL,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        """,
+        _fill_daily_stats,
+    ],
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# Bases déjà mises à jour par ce processus (init_db est appelé à chaque rerun de main.py)
+_migrated_db_files = set()
+
+def get_schema_version():
+    """Version du schéma de la base (nombre de migrations appliquées)"""
+    return query("PRAGMA user_version")[0][0]
+
+def migrate():
+    """
+    Applique les migrations manquantes dans une seule transaction et renvoie la nouvelle version.
+    La version est relue une fois le verrou d'écriture pris, si bien que deux processus
+    qui démarrent en même temps n'appliquent pas deux fois la même migration.
+    """
+    with transaction() as cursor:
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(f"PRAGMA user_version = {number}")
+    return max(version, SCHEMA_VERSION)
+
+def init_db():
+    """Crée les tables et applique les migrations manquantes (une seule fois par processus)"""
+    if DB_FILE in _migrated_db_files:
+        return
+    if get_schema_version() < SCHEMA_VERSION:
+        migrate()
+    _migrated_db_files.add(DB_FILE)
 
-def import_garmin_data(garmin_id, garmin_password):
+# Colonnes d'une activité importée, dans l'ordre des requêtes d'insertion
+ACTIVITY_FIELDS = ["activity_name", "start_time", "calories", "bmrCalories", "steps"]
+# Nombre maximal de paramètres d'une requête "IN (?, ?, ...)" (limite de SQLite : 999 ou plus)
+SQL_VARIABLES_LIMIT = 900
+
+def upsert_activities(user_id, activities):
+    """
+    Enregistre un lot d'activités (dicts au format de garmin_sync.parse_activity) en une transaction :
+    les nouvelles sont insérées, celles qui ont changé sont mises à jour et les autres ignorées
+    (ainsi que celles qui appartiennent à un autre utilisateur).
+    Renvoie {"inserted": n, "updated": n, "skipped": n}.
+    """
+    # Une seule ligne par identifiant (la dernière reçue)
+    rows = {int(activity["id"]): tuple(activity[field] for field in ACTIVITY_FIELDS) for activity in activities}
+    counts = {"inserted": 0, "updated": 0, "skipped": len(activities) - len(rows)}
+    ids = list(rows)
+
+    with transaction() as cursor:
+        existing = {}
+        for start in range(0, len(ids), SQL_VARIABLES_LIMIT):
+            batch = ids[start:start + SQL_VARIABLES_LIMIT]
+            cursor.execute(f"""
+            SELECT id, user_id, {', '.join(ACTIVITY_FIELDS)} FROM activities
+            WHERE id IN ({', '.join('?' * len(batch))})
+            """, batch)
+            existing.update((row[0], (row[1], row[2:])) for row in cursor.fetchall())
+
+        to_insert, to_update = [], []
+        for activity_id, values in rows.items():
+            if activity_id not in existing:
+                to_insert.append((activity_id, user_id, *values))
+            elif existing[activity_id][0] != user_id or existing[activity_id][1] == values:
+                counts["skipped"] += 1
+            else:
+                to_update.append((*values, activity_id))
+
+        # Jours dont la synthèse change (ancien et nouveau jour d'une activité déplacée)
+        start_time = ACTIVITY_FIELDS.index("start_time")
+        days = [row[2 + start_time] for row in to_insert] + [row[start_time] for row in to_update] \
+            + [existing[row[-1]][1][start_time] for row in to_update]
+
+        cursor.executemany(f"""
+        INSERT INTO activities (id, user_id, {', '.join(ACTIVITY_FIELDS)})
+        VALUES (?, ?, {', '.join('?' * len(ACTIVITY_FIELDS))})
+        """, to_insert)
+        cursor.executemany(f"""
+        UPDATE activities SET {', '.join(f'{field} = ?' for field in ACTIVITY_FIELDS)} WHERE id = ?
+        """, to_update)
+        refresh_daily_stats(cursor, user_id, [day[:10] for day in days if day])
+        if to_insert or to_update:
+            bump_data_version(user_id)
+    counts["inserted"], counts["updated"] = len(to_insert), len(to_update)
+    return counts
+
+def add_activity(user_id, garmin_id, garmin_password):
+    """
+    Importe les nouvelles activités Garmin d'un utilisateur sans doublons (synchronisation incrémentale).
+    Renvoie les compteurs de upsert_activities, ou None si la synchronisation a échoué.
+    """
+    from helpers.garmin_sync import sync_user  # Imported here: garmin_sync depends on this module
     try:
-        print(garmin_id, garmin_password)
-        client = Garmin(garmin_id, garmin_password)
-        client.login()
-        
-        # Get latest activities
-        activities = client.get_activities(0, 5)  # Fetch last 5 activities
-        # Convert activities to a list of dictionaries
-        filtered_activities = [
-            {
-                "id": activity["activityId"],
-                "activity_name": activity["activityName"],
-                "start_time": activity["startTimeLocal"],
-                "calories": activity["calories"],
-                "bmrCalories": activity["bmrCalories"],
-                "steps": activity["steps"]
-            }
-            for activity in activities
-        ]
-        return filtered_activities
+        return sync_user(user_id, garmin_id, garmin_password)
     except Exception as e:
         print(e)
         return None
 
-def add_activity(user_id, garmin_id, garmin_password):
-    """Ajoute une activité à un utilisateur sans doublons"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Get activities from Garmin
-    activities = import_garmin_data(garmin_id, garmin_password)
-    if activities is None:
-        return False
-    try:
-        for activity in activities:
-            cursor.execute("""
-            INSERT INTO activities (id, user_id, activity_name, start_time, calories, bmrCalories, steps) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)""", 
-            (activity["id"], user_id, activity["activity_name"], activity["start_time"], activity["calories"], activity["bmrCalories"], activity["steps"]))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        conn.close()
-        return False
-
-    conn.close()
-    return True
-
 
 def get_garmin_id(user_id):
     """Récupère l'identifiant Garmin et le mot de passe d'un utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT garmin_id, garmin_password FROM users WHERE id = ?", (user_id,))
-    garmin_id, garmin_password = cursor.fetchone()
-    conn.close()
+    garmin_id, garmin_password = get_connection().execute(
+        "SELECT garmin_id, garmin_password FROM users WHERE id = ?", (user_id,)).fetchone()
     return garmin_id, garmin_password
 
 def get_activities(username):
     """Récupère toutes les activités d'un utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute("""
+    return query("""
     SELECT activity_name, start_time, calories, bmrCalories, steps 
     FROM activities 
     JOIN users ON activities.user_id = users.id 
     WHERE users.username = ?
     """, (username,))
 
-    activities = cursor.fetchall()
-    conn.close()
-    return activities
-
 def add_poids(user_id, poid):
     """Ajoute une nouvelle entrée de poids pour un utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-    INSERT INTO poids (user_id, poid, date) VALUES (?, ?, ?)
-    """, (user_id, poid, date.today()))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO poids (user_id, poid, date) VALUES (?, ?, ?)
+        """, (user_id, poid, date.today()))
+        refresh_daily_stats(cursor, user_id, [date.today()])
+        bump_data_version(user_id)
 
 def get_poids(user_id):
     """Récupère l'historique de poids d'un utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return query("""
     SELECT poid, date FROM poids WHERE user_id = ? ORDER BY date DESC
     """, (user_id,))
-    poids = cursor.fetchall()  
-    conn.close()
-    return poids    
 
 def add_pdv(user_id, calories, total_fat_PDV=None, sugar_PDV=None, sodium_PDV=None, protein_PDV=None, saturated_fat_PDV=None, carbohydrates_PDV=None):
     """Ajoute une entrée de pourcentage de valeurs nutritionnelles"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-    INSERT INTO pdv (user_id, calories, total_fat_PDV, sugar_PDV, sodium_PDV, protein_PDV, saturated_fat_PDV, carbohydrates_PDV, date)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, calories, total_fat_PDV, sugar_PDV, sodium_PDV, protein_PDV, saturated_fat_PDV, carbohydrates_PDV, date.today()))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO pdv (user_id, calories, total_fat_PDV, sugar_PDV, sodium_PDV, protein_PDV, saturated_fat_PDV, carbohydrates_PDV, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, calories, total_fat_PDV, sugar_PDV, sodium_PDV, protein_PDV, saturated_fat_PDV, carbohydrates_PDV, date.today()))
+        refresh_daily_stats(cursor, user_id, [date.today()])
+        bump_data_version(user_id)
 
 def get_pdv(user_id):
     """Récupère les valeurs nutritionnelles pour un utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
+    return query("""
     SELECT calories, total_fat_PDV, sugar_PDV, sodium_PDV, protein_PDV, saturated_fat_PDV, carbohydrates_PDV, date 
     FROM pdv WHERE user_id = ? ORDER BY date DESC
     """, (user_id,))
-    pdv_data = cursor.fetchall()
-    conn.close()
-    return pdv_data
+
+def get_daily_stats(user_id, since=None):
+    """
+    Synthèse journalière d'un utilisateur depuis le jour `since` (tout l'historique si None),
+    par jour croissant : (day, calories_burned, steps, calories_eaten, *_PDV..., weight)
+    """
+    return query(f"""
+    SELECT day, {', '.join(DAILY_STATS_COLUMNS)} FROM daily_user_stats
+    WHERE user_id = ? AND day >= ? ORDER BY day
+    """, (user_id, str(since or "")))
+
+def get_last_weight(user_id):
+    """Dernier poids enregistré d'un utilisateur (None s'il n'y en a pas)"""
+    rows = query("""
+    SELECT weight FROM daily_user_stats WHERE user_id = ? AND weight IS NOT NULL ORDER BY day DESC LIMIT 1
+    """, (user_id,))
+    return rows[0][0] if rows else None
+
+def get_activity_counts(user_id, since=None):
+    """Nombre d'activités par type d'un utilisateur depuis le jour `since`"""
+    return query("""
+    SELECT activity_name, COUNT(*) FROM activities
+    WHERE user_id = ? AND start_time >= ? GROUP BY activity_name
+    """, (user_id, str(since or "")))
+
+def get_dashboard_snapshot(username, since=None):
+    """
+    Toutes les données du tableau de bord d'un utilisateur, lues dans une seule transaction
+    (donc cohérentes entre elles), ou None si l'utilisateur n'existe pas.
+    La version des données est relevée avant la lecture : un cache de l'instantané est
+    valide tant que get_data_version(user_id) la renvoie encore.
+    """
+    rows = query("SELECT id FROM users WHERE username = ?", (username,))
+    if not rows:
+        return None
+    user_id = rows[0][0]
+    # Relevée avant le premier SELECT de la transaction, qui fixe l'instantané de lecture :
+    # une écriture validée après ce SELECT incrémente forcément une version plus récente
+    version = get_data_version(user_id)
+    with transaction(immediate=False):
+        user = get_user(username)
+        if user is None:
+            return None
+        snapshot = {"user": user, "version": version, "since": since}
+        snapshot["last_weight"] = get_last_weight(user_id)
+        snapshot["daily_stats"] = get_daily_stats(user_id, since)
+        snapshot["activity_counts"] = get_activity_counts(user_id, since)
+        last_synced = query("SELECT last_synced_at FROM garmin_sync WHERE user_id = ?", (user_id,))
+        snapshot["last_synced_at"] = last_synced[0][0] if last_synced else None
+    return snapshot
 
 def hash_password(password):
     """Hash le mot de passe"""
@@ -210,39 +506,25 @@ def verify_password(password, hashed_password):
 
 def register_user(username, password, birth_date, height, weight, gender, garmin_id=None, garmin_password=None):
     """Ajoute un utilisateur dans la base avec les nouvelles données"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
     try:
         password_hash = hash_password(password)
         #garmin_password_hash = hash_password(garmin_password) if garmin_password else None
         
-        cursor.execute("""
-        INSERT INTO users (username, password_hash, birth_date, height, weight, gender, garmin_id, garmin_password) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (username, password_hash, birth_date.strftime('%Y-%m-%d'), height, weight, gender, garmin_id, garmin_password))
-        
-        conn.commit()
+        with transaction() as cursor:
+            cursor.execute("""
+            INSERT INTO users (username, password_hash, birth_date, height, weight, gender, garmin_id, garmin_password) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (username, password_hash, birth_date.strftime('%Y-%m-%d'), height, weight, gender, garmin_id, garmin_password))
         return True
     except sqlite3.IntegrityError:
         return False  # L'utilisateur existe déjà
-    finally:
-        conn.close()
         
 def get_user(username):
     """Récupère les infos d'un utilisateur par son username"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    return get_connection().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
 
 def update_user_info(username, birth_date=None, weight=None, height=None,  gender=None, garmin_id=None, garmin_password=None):
     """Met à jour les informations de l'utilisateur"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
     updates = []
     values = []
 
@@ -268,32 +550,28 @@ def update_user_info(username, birth_date=None, weight=None, height=None,  gende
         values.append(garmin_password)
 
     if not updates:
-        conn.close()
         return False  # Rien à mettre à jour
 
     values.append(username)
     query = f"UPDATE users SET {', '.join(updates)} WHERE username = ?"
     
-    cursor.execute(query, values)
-    #garmin_password_hash = hash_password(garmin_password) if garmin_password else None
-    cursor.execute("""
-    UPDATE users 
-    SET birth_date = ?, weight = ?, height = ?, gender = ?, garmin_id = ?, garmin_password = ?
-    WHERE username = ?
-    """, (birth_date, weight, height, gender, garmin_id, garmin_password, username))
-    conn.commit()
-    conn.close()
+    with transaction() as cursor:
+        cursor.execute(query, values)
+        #garmin_password_hash = hash_password(garmin_password) if garmin_password else None
+        cursor.execute("""
+        UPDATE users 
+        SET birth_date = ?, weight = ?, height = ?, gender = ?, garmin_id = ?, garmin_password = ?
+        WHERE username = ?
+        """, (birth_date, weight, height, gender, garmin_id, garmin_password, username))
+        for user_id, in cursor.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchall():
+            bump_data_version(user_id)
     
     return True
 
 def get_calories(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
     today = date.today().strftime('%Y-%m-%d')
-    cursor.execute("""
-    SELECT calories FROM activities WHERE user_id = ? AND DATE(start_time) = ?
-    """, (user_id, today))
-    calories = cursor.fetchone()
-    conn.close()
+    calories = get_connection().execute("""
+    SELECT calories FROM activities WHERE user_id = ? AND start_date = ?
+    """, (user_id, today)).fetchone()
     print("CALORIES", calories)
-    return calories
\ No newline at end of file
+    return calories
@@ -1,37 +1,350 @@
 from ultralytics import YOLO
-import matplotlib.pyplot as plt
+from collections import OrderedDict
+import numpy as np
+import cv2
+import threading
+import hashlib
+import json
+import time
 import os
 
-image_output_folder = r"data\fridge_images\output"
+image_output_folder = os.path.join("data", "fridge_images", "output")
+model_path = os.path.join("data", "yolo11_finetuned.pt")
+
+# Backend d'inférence : "pytorch", "onnx" ou "openvino" (modèles exportés avec export_model)
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "pytorch")
+# Utiliser le modèle exporté quantifié en INT8
+DETECTION_INT8 = os.getenv("DETECTION_INT8", "0") == "1"
+# Mode debug : écrire aussi les images annotées dans image_output_folder
+save_annotated_images = False
+
+# Taille d'entrée des modèles exportés (celle de l'entraînement)
+EXPORT_IMGSZ = 640
+
+# Niveaux d'inférence : la résolution d'entrée est le principal coût sur CPU.
+# Un modèle ONNX/OpenVINO exporté à taille fixe refuse les autres imgsz : tier_settings
+# ramène alors imgsz à sa taille (seuls conf et max_det changent d'un niveau à l'autre).
+INFERENCE_TIERS = {
+    "fast": {"imgsz": 416, "conf": 0.35, "max_det": 50},
+    "balanced": {"imgsz": 640, "conf": 0.25, "max_det": 100},
+    "accurate": {"imgsz": 960, "conf": 0.20, "max_det": 300},
+}
+# "fast", "balanced", "accurate" ou "auto"
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "auto")
+# Mode auto : réduire les grandes photos, puis monter en résolution
+# tant que moins de AUTO_MIN_INGREDIENTS ingrédients sont trouvés
+AUTO_MAX_SIDE = 1280
+AUTO_MIN_INGREDIENTS = 3
+AUTO_TIERS = ["fast", "balanced", "accurate"]
+
+# Modèle YOLOv11 partagé par toutes les sessions Streamlit du processus,
+# et la taille d'entrée qu'il impose (None : toutes les tailles)
+_model = None
+_model_imgsz = None
+_model_lock = threading.Lock()
+# Le predictor d'ultralytics n'est pas thread-safe : une inférence à la fois
+_predict_lock = threading.Lock()
+
+# Cache des détections, indexé par le hash du contenu de l'image (LRU en mémoire)
+DETECTION_CACHE_SIZE = 32
+# Dossier pour garder aussi les détections sur disque (None = mémoire seulement)
+detection_cache_folder = None
+_detection_cache = OrderedDict()
+_detection_cache_lock = threading.Lock()
+
+def backend_model_path(backend, int8=False):
+    """Path of the model file (or folder, for OpenVINO) of an inference backend."""
+    base = os.path.splitext(model_path)[0]
+    if backend == "pytorch":
+        return model_path
+    if backend == "onnx":
+        return base + ("_int8.onnx" if int8 else ".onnx")
+    if backend == "openvino":
+        return base + ("_int8_openvino_model" if int8 else "_openvino_model")
+    raise ValueError(f"Unknown detection backend: {backend}")
+
+def export_shape_path(backend, int8=False):
+    """Path of the JSON file recording the input shape of an exported model."""
+    return backend_model_path(backend, int8) + ".shape.json"
+
+def export_model(backend, int8=False, data=None):
+    """
+    Exports the fine-tuned PyTorch model for CPU inference with ONNX Runtime or OpenVINO,
+    with dynamic input shapes so that every inference tier (imgsz) and batch size can run.
+    OpenVINO INT8 uses ultralytics' calibration on `data` (a dataset yaml);
+    ONNX INT8 applies ONNX Runtime dynamic quantization to the exported model.
+    The input shape is recorded next to the model (see exported_imgsz).
+    Returns the path of the exported model.
+    """
+    target_path = backend_model_path(backend, int8)
+    model = YOLO(model_path)
+    if backend == "onnx":
+        exported = model.export(format="onnx", dynamic=True)
+        if int8:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(exported, target_path, weight_type=QuantType.QUInt8)
+            exported = target_path
+    elif backend == "openvino":
+        exported = model.export(format="openvino", dynamic=True, int8=int8, data=data)
+    else:
+        raise ValueError(f"Cannot export to backend: {backend}")
+    if os.path.abspath(exported) != os.path.abspath(target_path):
+        os.replace(exported, target_path)
+    with open(export_shape_path(backend, int8), "w") as f:
+        json.dump({"dynamic": True, "imgsz": EXPORT_IMGSZ}, f)
+    return target_path
+
+def exported_imgsz(backend, int8=False):
+    """
+    Input size that the model of a backend requires, or None if it accepts any size
+    (PyTorch, or an export with dynamic shapes). Exports without a shape record predate
+    dynamic export: ultralytics exported them with a fixed EXPORT_IMGSZ input.
+    """
+    if backend == "pytorch":
+        return None
+    try:
+        with open(export_shape_path(backend, int8)) as f:
+            shape = json.load(f)
+    except FileNotFoundError:
+        return EXPORT_IMGSZ
+    return None if shape["dynamic"] else shape["imgsz"]
+
+def load_model(backend="pytorch", int8=False):
+    """Loads the model of an inference backend and warms it up with a dummy inference."""
+    model = YOLO(backend_model_path(backend, int8), task="detect")
+    # Warm-up : la première inférence initialise le predictor
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+    return model
+
+def get_model():
+    """
+    Returns the fine-tuned YOLOv11 model of the configured backend (DETECTION_BACKEND),
+    loaded once per process and warmed up with a dummy inference.
+    """
+    global _model, _model_imgsz
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model_imgsz = exported_imgsz(DETECTION_BACKEND, DETECTION_INT8)
+                _model = load_model(DETECTION_BACKEND, DETECTION_INT8)
+    return _model
+
+def tier_settings(tier):
+    """
+    predict() settings of an inference tier for the shared model. A model exported with
+    a fixed input size fails on any other imgsz, so imgsz is clamped to that size.
+    """
+    get_model()
+    settings = dict(INFERENCE_TIERS[tier])
+    if _model_imgsz is not None:
+        settings["imgsz"] = _model_imgsz
+    return settings
+
+def predict(source, **kwargs):
+    """Runs the shared model on an image, serializing concurrent calls."""
+    model = get_model()
+    with _predict_lock:
+        return model.predict(source, verbose=False, **kwargs)
+
+def extract_detections(result):
+    """Returns the detections of one YOLO result as a list of {class, confidence, box} dicts."""
+    detections = []
+    for label, confidence, box in zip(result.boxes.cls, result.boxes.conf, result.boxes.xyxy):
+        detections.append({
+            "class": result.names[int(label)],
+            "confidence": round(float(confidence), 4),
+            "box": [round(float(v), 1) for v in box],
+        })
+    return detections
+
+def list_images(folder):
+    """Lists the jpg/jpeg/png images of a folder, sorted by name."""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))]
+
+def analyse_frigo_batch(image_paths, batch_size=8, output_folder=image_output_folder):
+    """
+    Streams image paths through batched inference.
+    For each image, saves the annotated image and a JSON file with the detections
+    in output_folder, and yields (image_path, detections).
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    image_paths = iter(image_paths)
+    while True:
+        batch = [path for _, path in zip(range(batch_size), image_paths)]
+        if not batch:
+            break
+        # batch= : ultralytics would otherwise run the list one image at a time (batch=1)
+        for image_path, result in zip(batch, predict(batch, batch=len(batch))):
+            detections = extract_detections(result)
+            image_name = os.path.basename(image_path)
+            result.save(os.path.join(output_folder, image_name))
+            with open(os.path.join(output_folder, os.path.splitext(image_name)[0] + ".json"), "w") as f:
+                json.dump({"image": image_path, "detections": detections}, f, indent=2)
+            yield image_path, detections
+
+def merge_detections(detections_per_image):
+    """Merges the detections of several photos of the same fridge into one ingredient set."""
+    return {detection["class"] for detections in detections_per_image for detection in detections}
+
+def decode_image(image):
+    """
+    Converts raw image bytes (jpg/png) or an image path to a BGR array, as expected by YOLO.
+    Arrays are returned unchanged.
+    """
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    elif isinstance(image, str):
+        decoded = cv2.imread(image, cv2.IMREAD_COLOR)
+    else:
+        return image
+    if decoded is None:
+        raise ValueError("Could not decode the image")
+    return decoded
+
+def downscale_image(image_array, max_side=AUTO_MAX_SIDE):
+    """Resizes an image so that its longest side is at most max_side pixels."""
+    height, width = image_array.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return image_array
+    return cv2.resize(image_array, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+def detect(image_array, mode=None):
+    """
+    Runs the model with the settings of an inference tier (see INFERENCE_TIERS and tier_settings).
+    In "auto" mode, large images are downscaled and the resolution is raised
+    only while fewer than AUTO_MIN_INGREDIENTS ingredients are found.
+    Returns (results, tier used).
+    """
+    mode = mode or INFERENCE_MODE
+    if mode != "auto":
+        return predict(image_array, **tier_settings(mode)), mode
+
+    image_array = downscale_image(image_array)
+    for tier in AUTO_TIERS:
+        results = predict(image_array, **tier_settings(tier))
+        found = {int(label) for label in results[0].boxes.cls}
+        if len(found) >= AUTO_MIN_INGREDIENTS:
+            break
+    return results, tier
+
+def encode_image(image_array):
+    """Encodes a BGR array as JPEG bytes."""
+    ok, buffer = cv2.imencode(".jpg", image_array)
+    if not ok:
+        raise ValueError("Could not encode the image")
+    return buffer.tobytes()
+
+def analyse_frigo(image, debug_output=None, image_name="debug.jpg", mode=None):
+    """
+    Detects the ingredients of a fridge image given as a path, raw bytes or a BGR array,
+    with the inference tier `mode` (default: INFERENCE_MODE).
+    Returns (set of detected ingredients, annotated image as JPEG bytes), fully in memory.
+    With debug_output (default: save_annotated_images), the annotated image
+    is also written to image_output_folder.
+    """
+    # Faire la prédiction sur l'image spécifiée avec le modèle partagé
+    results, _ = detect(decode_image(image), mode)
 
-def analyse_frigo(image_path):
-    # Charger le modèle YOLOv11 entraîné
-    model = YOLO("data\yolo11_finetuned.pt")
-    
-    # Faire la prédiction sur l'image spécifiée
-    results = model.predict(image_path, verbose=False)
-    
     # Récupérer les noms des objets détectés (cela appartient à la classe 'results')
     detected_classes = results[0].names  # Accéder à l'objet de résultat (le premier élément de la liste)
-    
+
     # Extraire les classes détectées
     food_detected = []
-    
+
     # Boucle à travers les résultats de détection
     for result in results:
         for label in result.boxes.cls:  # Vérifier chaque classe détectée
             food_name = detected_classes[int(label)]  # Convertir l'index en nom de la classe
             food_detected.append(food_name)
 
-    # Sauvegarder l'image avec les boîtes et les labels
-    image_name = os.path.basename(image_path)
-    image_output_path = os.path.join(image_output_folder, image_name)
-    results[0].save(image_output_path)  # Sauvegarder l'image annotée
-    
-    # Afficher l'image
-    # img = plt.imread(image_output_path)
-    # plt.imshow(img)
-    # plt.axis('off')  # Désactive les axes
-    # plt.show()
-    
-    return set(food_detected)
\ No newline at end of file
+    # Dessiner les boîtes et les labels en mémoire
+    annotated_image = encode_image(results[0].plot())
+
+    # Sauvegarder l'image annotée seulement en mode debug
+    if debug_output is None:
+        debug_output = save_annotated_images
+    if debug_output:
+        if isinstance(image, str):
+            image_name = os.path.basename(image)
+        os.makedirs(image_output_folder, exist_ok=True)
+        with open(os.path.join(image_output_folder, image_name), "wb") as f:
+            f.write(annotated_image)
+
+    return set(food_detected), annotated_image
+
+def image_hash(image_bytes):
+    """Content hash used as the detection cache key."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def _get_cached_detection(key):
+    with _detection_cache_lock:
+        if key in _detection_cache:
+            _detection_cache.move_to_end(key)
+            return _detection_cache[key]
+    if detection_cache_folder:
+        json_path = os.path.join(detection_cache_folder, key + ".json")
+        image_path = os.path.join(detection_cache_folder, key + ".jpg")
+        if os.path.exists(json_path) and os.path.exists(image_path):
+            with open(json_path) as f:
+                ingredients = set(json.load(f)["ingredients"])
+            with open(image_path, "rb") as f:
+                annotated_image = f.read()
+            _store_cached_detection(key, (ingredients, annotated_image), to_disk=False)
+            return ingredients, annotated_image
+    return None
+
+def _store_cached_detection(key, value, to_disk=True):
+    with _detection_cache_lock:
+        _detection_cache[key] = value
+        _detection_cache.move_to_end(key)
+        while len(_detection_cache) > DETECTION_CACHE_SIZE:
+            _detection_cache.popitem(last=False)
+    if to_disk and detection_cache_folder:
+        os.makedirs(detection_cache_folder, exist_ok=True)
+        ingredients, annotated_image = value
+        with open(os.path.join(detection_cache_folder, key + ".jpg"), "wb") as f:
+            f.write(annotated_image)
+        with open(os.path.join(detection_cache_folder, key + ".json"), "w") as f:
+            json.dump({"ingredients": sorted(ingredients)}, f)
+
+def analyse_frigo_cached(image_bytes, mode=None):
+    """
+    Returns (detected ingredients, annotated image bytes) for an uploaded or captured image.
+    Results are memoized by content hash, so Streamlit reruns on the same photo skip YOLO.
+    """
+    mode = mode or INFERENCE_MODE
+    key = image_hash(image_bytes) + "_" + mode
+    cached = _get_cached_detection(key)
+    if cached is not None:
+        return cached
+
+    ingredients, annotated_image = analyse_frigo(image_bytes, mode=mode)
+    _store_cached_detection(key, (ingredients, annotated_image))
+    return ingredients, annotated_image
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Detect the ingredients of a folder of fridge images.")
+    parser.add_argument("input_folder", nargs="?", default=os.path.join("data", "fridge_images", "input"))
+    parser.add_argument("--output", default=image_output_folder, help="folder for annotated images and JSON detections")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--merge", action="store_true", help="merge all images into one ingredient set (same fridge)")
+    args = parser.parse_args()
+
+    image_paths = list_images(args.input_folder)
+    get_model()  # Load and warm up before timing
+    start = time.perf_counter()
+    all_detections = []
+    for image_path, detections in analyse_frigo_batch(image_paths, args.batch_size, args.output):
+        all_detections.append(detections)
+        print(f"{os.path.basename(image_path)}: {sorted({d['class'] for d in detections})}")
+    elapsed = time.perf_counter() - start
+
+    if args.merge:
+        merged = sorted(merge_detections(all_detections))
+        with open(os.path.join(args.output, "merged.json"), "w") as f:
+            json.dump({"images": image_paths, "ingredients": merged}, f, indent=2)
+        print(f"Merged ingredients: {merged}")
+    print(f"Processed {len(image_paths)} images in {elapsed:.2f}s ({len(image_paths) / max(elapsed, 1e-9):.2f} images/sec)")
@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers.database import query, transaction, upsert_activities
+from helpers.garmin_sync import get_client, garmin_rate_limiter, parse_activity
+
+# History imported when a Garmin account is linked
+BACKFILL_YEARS = 5
+# Days per date range (unit of work, of progress and of resumption)
+RANGE_DAYS = 30
+# Date ranges fetched at the same time (the requests are globally rate limited)
+BACKFILL_WORKERS = 4
+# Activities per request
+BACKFILL_PAGE_SIZE = 100
+
+# Users whose backfill is running in this process
+_running = set()
+_running_lock = threading.Lock()
+
+def date_ranges(start, end, days=RANGE_DAYS):
+    """Consecutive (first day, last day) ranges covering start..end, most recent first."""
+    ranges = []
+    range_end = end
+    while range_end >= start:
+        range_start = max(start, range_end - timedelta(days=days - 1))
+        ranges.append((range_start.isoformat(), range_end.isoformat()))
+        range_end = range_start - timedelta(days=1)
+    return ranges
+
+def plan_backfill(user_id, years=BACKFILL_YEARS, range_days=RANGE_DAYS, today=None):
+    """
+    Records the date ranges of a user's history to import. Ranges already planned are kept
+    (with their status), so planning again only adds the days since the last plan.
+    Returns the number of new ranges.
+    """
+    today = today or date.today()
+    ranges = date_ranges(today - timedelta(days=365 * years), today, range_days)
+    with transaction() as cursor:
+        # The most recent range was planned up to its day: extend the plan from the day after
+        last_end = cursor.execute("SELECT MAX(range_end) FROM garmin_backfill WHERE user_id = ?", (user_id,)).fetchone()[0]
+        if last_end is not None:
+            ranges = date_ranges(date.fromisoformat(last_end) + timedelta(days=1), today, range_days)
+        cursor.executemany("""
+        INSERT OR IGNORE INTO garmin_backfill (user_id, range_start, range_end) VALUES (?, ?, ?)
+        """, [(user_id, range_start, range_end) for range_start, range_end in ranges])
+    return len(ranges)
+
+def get_backfill_progress(user_id):
+    """Progress of a user's backfill for the UI (dict), or None if none was planned."""
+    total, done, failed, activities = query("""
+    SELECT COUNT(*), SUM(status = 'done'), SUM(status = 'error'), SUM(activities)
+    FROM garmin_backfill WHERE user_id = ?
+    """, (user_id,))[0]
+    if not total:
+        return None
+    with _running_lock:
+        running = user_id in _running
+    return {"ranges": total, "done": done, "failed": failed, "activities": activities, "running": running}
+
+def fetch_range(client, range_start, range_end, page_size=BACKFILL_PAGE_SIZE):
+    """All the activities (every type) started between two days included, one rate-limited request per page."""
+    activities = []
+    start = 0
+    while True:
+        garmin_rate_limiter.acquire()
+        page = client.connectapi(client.garmin_connect_activities, params={
+            "startDate": range_start, "endDate": range_end, "start": str(start), "limit": str(page_size),
+        }) or []
+        activities.extend(page)
+        if len(page) < page_size:
+            return activities
+        start += page_size
+
+def backfill_range(user_id, client, range_start, range_end):
+    """
+    Imports one range: its activities are upserted and the range marked as done in the same
+    transaction, so a crash never leaves a range half imported and marked done.
+    """
+    try:
+        activities = [parse_activity(activity) for activity in fetch_range(client, range_start, range_end)]
+    except Exception as e:
+        with transaction() as cursor:
+            cursor.execute("""
+            UPDATE garmin_backfill SET status = 'error', error = ? WHERE user_id = ? AND range_start = ?
+            """, (str(e) or type(e).__name__, user_id, range_start))
+        return None
+    with transaction() as cursor:
+        counts = upsert_activities(user_id, activities)
+        cursor.execute("""
+        UPDATE garmin_backfill SET status = 'done', activities = ?, error = NULL WHERE user_id = ? AND range_start = ?
+        """, (len(activities), user_id, range_start))
+    return counts
+
+def run_backfill(user_id, garmin_id, garmin_password, workers=BACKFILL_WORKERS, client=None):
+    """
+    Imports the ranges of a user that are not done yet (all of them the first time, the
+    remaining ones after a crash, the failed ones again), `workers` ranges at a time,
+    most recent first. Returns the progress.
+    """
+    pending = query("""
+    SELECT range_start, range_end FROM garmin_backfill
+    WHERE user_id = ? AND status != 'done' ORDER BY range_start DESC
+    """, (user_id,))
+    if pending:
+        client = client or get_client(user_id, garmin_id, garmin_password)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="garmin-backfill") as executor:
+            list(executor.map(lambda r: backfill_range(user_id, client, *r), pending))
+    return get_backfill_progress(user_id)
+
+def start_backfill(user_id, garmin_id, garmin_password):
+    """
+    Plans (or extends) and runs a user's backfill in a background thread.
+    Does nothing if it is already running in this process. Returns False in that case.
+    """
+    with _running_lock:
+        if user_id in _running:
+            return False
+        _running.add(user_id)
+
+    def run():
+        try:
+            plan_backfill(user_id)
+            run_backfill(user_id, garmin_id, garmin_password)
+        except Exception as e:
+            print(f"Garmin backfill of user {user_id} failed: {e}")
+        finally:
+            with _running_lock:
+                _running.discard(user_id)
+
+    threading.Thread(target=run, name=f"garmin-backfill-{user_id}", daemon=True).start()
+    return True
+
+def resume_backfills():
+    """Restarts the backfills interrupted by a crash or a restart. Returns the users resumed."""
+    users = query("""
+    SELECT DISTINCT users.id, users.garmin_id, users.garmin_password
+    FROM garmin_backfill JOIN users ON users.id = garmin_backfill.user_id
+    WHERE garmin_backfill.status = 'pending' AND users.garmin_id IS NOT NULL AND users.garmin_password IS NOT NULL
+    """)
+    return [user_id for user_id, garmin_id, garmin_password in users
+            if start_backfill(user_id, garmin_id, garmin_password)]
@@ -0,0 +1,151 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers.database import bump_data_version, query, transaction, upsert_activities
+
+# Activities requested per call to Garmin Connect (newest first)
+PAGE_SIZE = 20
+
+# Global limit on the requests sent to Garmin Connect by this process (all users together)
+GARMIN_REQUESTS_PER_SECOND = 1.0
+GARMIN_REQUESTS_BURST = 5
+# Requests made by a login (SSO or token) before the first activity page
+LOGIN_REQUESTS = 3
+
+class RateLimiter:
+    """Token bucket shared by threads: at most `rate` calls per second on average, bursts of `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Takes tokens, sleeping until they are available. Callers are served in arrival order."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+garmin_rate_limiter = RateLimiter(GARMIN_REQUESTS_PER_SECOND, GARMIN_REQUESTS_BURST)
+
+# Logged-in clients of this process, by user id: a sync after the first one needs no login at all
+_clients = {}
+_clients_lock = threading.Lock()
+
+def parse_activity(activity):
+    """Garmin Connect activity -> row of the activities table (missing metrics are None)."""
+    return {
+        "id": activity["activityId"],
+        "activity_name": activity.get("activityName"),
+        "start_time": activity["startTimeLocal"],
+        "calories": activity.get("calories"),
+        "bmrCalories": activity.get("bmrCalories"),
+        "steps": activity.get("steps"),
+    }
+
+def get_sync_state(user_id):
+    """(garth session tokens, start_time of the most recent synced activity) of a user, None if unknown."""
+    # Before the first sync, the activities already in the database give the watermark
+    return query("""
+    SELECT (SELECT garth_tokens FROM garmin_sync WHERE user_id = ?),
+           COALESCE((SELECT last_start_time FROM garmin_sync WHERE user_id = ?),
+                    (SELECT MAX(start_time) FROM activities WHERE user_id = ?))
+    """, (user_id, user_id, user_id))[0]
+
+def save_tokens(user_id, tokens):
+    with transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO garmin_sync (user_id, garth_tokens) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET garth_tokens = excluded.garth_tokens
+        """, (user_id, tokens))
+
+def save_watermark(cursor, user_id, last_start_time):
+    cursor.execute("""
+    INSERT INTO garmin_sync (user_id, last_start_time, last_synced_at) VALUES (?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        last_start_time = COALESCE(MAX(last_start_time, excluded.last_start_time), last_start_time, excluded.last_start_time),
+        last_synced_at = excluded.last_synced_at
+    """, (user_id, last_start_time, datetime.now().isoformat(timespec="seconds")))
+    # The dashboard shows the time of the last sync
+    bump_data_version(user_id)
+
+def get_client(user_id, garmin_id, garmin_password):
+    """
+    Logged-in Garmin client of a user. The garth session tokens are stored in the database
+    and reused (garth refreshes them itself), so the full SSO login with the password
+    only happens for the first sync or when the stored session is no longer valid.
+    """
+    with _clients_lock:
+        client = _clients.get(user_id)
+    if client is not None and client.username == garmin_id:
+        return client
+
+    from garminconnect import Garmin  # Imported here: only needed when syncing
+    client = Garmin(garmin_id, garmin_password)
+    tokens, _ = get_sync_state(user_id)
+    garmin_rate_limiter.acquire(LOGIN_REQUESTS)
+    try:
+        if not tokens:
+            raise ValueError("No stored Garmin session")
+        client.login(tokens)
+    except Exception:
+        client.login()
+    save_tokens(user_id, client.garth.dumps())
+
+    with _clients_lock:
+        _clients[user_id] = client
+    return client
+
+def forget_client(user_id):
+    """Drops the cached client, e.g. after an authentication error."""
+    with _clients_lock:
+        _clients.pop(user_id, None)
+
+def fetch_new_activities(client, watermark, page_size=PAGE_SIZE):
+    """
+    Pages through the activities, newest first, until reaching the watermark (the start_time
+    of the most recent activity already synced). Activities starting at the watermark are
+    kept so that an activity edited since is updated. Without a watermark (no activity
+    synced yet), only the most recent page is fetched.
+    """
+    activities = []
+    start = 0
+    while True:
+        garmin_rate_limiter.acquire()
+        page = client.get_activities(start, page_size) or []
+        new = [activity for activity in page if watermark is None or activity["startTimeLocal"] >= watermark]
+        activities.extend(new)
+        if watermark is None or len(page) < page_size or len(new) < len(page):
+            return activities
+        start += page_size
+
+def sync_user(user_id, garmin_id, garmin_password, client=None):
+    """
+    Incremental sync of a user's Garmin activities. The new activities are upserted and
+    the watermark advanced in the same transaction. Returns the counts of upsert_activities.
+    """
+    try:
+        client = client or get_client(user_id, garmin_id, garmin_password)
+        _, watermark = get_sync_state(user_id)
+        activities = [parse_activity(activity) for activity in fetch_new_activities(client, watermark)]
+    except Exception:
+        forget_client(user_id)
+        raise
+    with transaction() as cursor:
+        counts = upsert_activities(user_id, activities)
+        save_watermark(cursor, user_id, max((activity["start_time"] for activity in activities), default=watermark))
+    # garth may have refreshed the OAuth2 token during the calls
+    if getattr(client, "garth", None) is not None:
+        save_tokens(user_id, client.garth.dumps())
+    return counts
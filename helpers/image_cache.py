@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Persistent cache of the Food.com image URL resolved for each recipe id.
+CACHE_FILE = "data/recipe_images.db"
+
+# Found URLs are kept for a month; misses are retried after a day.
+TTL_SECONDS = 30 * 24 * 3600
+NEGATIVE_TTL_SECONDS = 24 * 3600
+
+# Returned by get_cached_image_url when the recipe has no valid entry.
+MISS = object()
+
+# One connection per thread and cache file, reused by every lookup of that thread
+# (dropped, and so closed, when the thread ends)
+_local = threading.local()
+# Cache files whose table exists, so CREATE TABLE runs once per file and process
+_created = set()
+_created_lock = threading.Lock()
+
+def _connect(cache_file):
+    cache_file = os.path.abspath(cache_file)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(cache_file)
+    if conn is None:
+        conn = connections[cache_file] = sqlite3.connect(cache_file, timeout=5.0)
+    if cache_file not in _created:
+        with _created_lock, conn:
+            if cache_file not in _created:
+                conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_urls (
+                    recipe_id INTEGER PRIMARY KEY,
+                    image_url TEXT,
+                    fetched_at REAL NOT NULL
+                )
+                """)
+                _created.add(cache_file)
+    return conn
+
+def get_cached_image_url(recipe_id, cache_file=CACHE_FILE, now=None):
+    """
+    Returns the cached image URL of a recipe, None for a cached miss,
+    or MISS if there is no valid (non-expired) entry.
+    """
+    now = time.time() if now is None else now
+    conn = _connect(cache_file)
+    row = conn.execute("SELECT image_url, fetched_at FROM image_urls WHERE recipe_id = ?", (int(recipe_id),)).fetchone()
+    if row is None:
+        return MISS
+    image_url, fetched_at = row
+    ttl = TTL_SECONDS if image_url else NEGATIVE_TTL_SECONDS
+    if now - fetched_at > ttl:
+        return MISS
+    return image_url
+
+def get_cached_image_urls(recipe_ids, cache_file=CACHE_FILE, now=None):
+    """Batch version of get_cached_image_url: returns {recipe_id: url or None} for the valid entries only."""
+    now = time.time() if now is None else now
+    recipe_ids = [int(recipe_id) for recipe_id in recipe_ids]
+    if not recipe_ids:
+        return {}
+    conn = _connect(cache_file)
+    placeholders = ", ".join("?" * len(recipe_ids))
+    rows = conn.execute(f"SELECT recipe_id, image_url, fetched_at FROM image_urls WHERE recipe_id IN ({placeholders})", recipe_ids).fetchall()
+    cached = {}
+    for recipe_id, image_url, fetched_at in rows:
+        ttl = TTL_SECONDS if image_url else NEGATIVE_TTL_SECONDS
+        if now - fetched_at <= ttl:
+            cached[recipe_id] = image_url
+    return cached
+
+def set_cached_image_url(recipe_id, image_url, cache_file=CACHE_FILE, now=None):
+    """Stores the resolved image URL of a recipe (None records a miss)."""
+    set_cached_image_urls({recipe_id: image_url}, cache_file, now)
+
+def set_cached_image_urls(image_urls, cache_file=CACHE_FILE, now=None):
+    """Stores several {recipe_id: url or None} entries in one transaction."""
+    now = time.time() if now is None else now
+    conn = _connect(cache_file)
+    with conn:
+        conn.executemany("""
+        INSERT OR REPLACE INTO image_urls (recipe_id, image_url, fetched_at) VALUES (?, ?, ?)
+        """, [(int(recipe_id), image_url, now) for recipe_id, image_url in image_urls.items()])
+
+def purge_expired(cache_file=CACHE_FILE, now=None):
+    """Deletes expired entries and returns how many were removed."""
+    now = time.time() if now is None else now
+    conn = _connect(cache_file)
+    with conn:
+        cursor = conn.execute("""
+        DELETE FROM image_urls
+        WHERE (image_url IS NOT NULL AND fetched_at < ?) OR (image_url IS NULL AND fetched_at < ?)
+        """, (now - TTL_SECONDS, now - NEGATIVE_TTL_SECONDS))
+    return cursor.rowcount
@@ -1,42 +1,186 @@
 import pandas as pd
-from fuzzywuzzy import fuzz
+import numpy as np
+from difflib import SequenceMatcher
+from itertools import chain
+from functools import partial
+import json
+from rapidfuzz import process, fuzz
 from tqdm import tqdm  # For progress bar
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from helpers.chunked_pipeline import estimate_chunksize, process_csv_in_chunks, DEFAULT_MAX_MEMORY_MB
+from helpers.recipe_catalog import INGREDIENT_CATEGORIES
 
-# Define the 30 ingredients/categories
-ingredients_categories = [
-    "apple", "banana", "beef", "blueberries", "bread", "butter", "carrot", "cheese", "chicken", "chicken_breast",
-    "chocolate", "corn", "eggs", "flour", "goat_cheese", "green_beans", "ground_beef", "ham", "heavy_cream",
-    "lime", "milk", "mushrooms", "onion", "potato", "shrimp", "spinach", "strawberries", "sugar", "sweet_potato", "tomato"
-]
+# Dataset paths
+file_path = "data/processed_recipes.csv"
+output_file = "data/processed_recipes_with_categories.csv"
+# Persistent ingredient -> category table, so that only new strings are fuzzy-matched
+mapping_file = "data/ingredient_categories.json"
+
+# The 30 ingredients/categories, shared with the recipe catalog (list order = bit of the recipe masks)
+ingredients_categories = INGREDIENT_CATEGORIES
+
+# Minimum partial_ratio (exclusive) for an ingredient to be mapped to a category
+MATCH_THRESHOLD = 80
+# Scorer recorded in the mapping table: tables built by another scorer (the rapidfuzz-only
+# matcher mapped e.g. "beer" to beef) are discarded and rebuilt
+MATCH_SCORER = "aligned_partial_ratio"
+# Number of ingredient strings scored per similarity matrix (bounds memory)
+MATCH_BLOCK_SIZE = 100_000
+
+def aligned_partial_ratio(s1, s2):
+    """
+    partial_ratio of fuzzywuzzy, the scorer of the first version: the shorter string is
+    compared (difflib ratio) with the windows of the longer one that start at its matching
+    blocks, so short windows at the start of the longer string are never scored.
+    rapidfuzz's partial_ratio scores every window and is an upper bound of this one.
+    """
+    if not s1 or not s2:
+        return 0
+    shorter, longer = (s1, s2) if len(s1) <= len(s2) else (s2, s1)
+    best = 0.0
+    for short_start, long_start, _ in SequenceMatcher(None, shorter, longer).get_matching_blocks():
+        long_start = max(long_start - short_start, 0)
+        ratio = SequenceMatcher(None, shorter, longer[long_start:long_start + len(shorter)]).ratio()
+        if ratio > .995:
+            return 100
+        best = max(best, ratio)
+    return int(round(100 * best))
+
+def match_categories(ingredients, threshold=MATCH_THRESHOLD, workers=-1, progress=False):
+    """
+    Batch fuzzy matcher, with the same results as the first version: an ingredient is mapped
+    to the first category, in list order, whose aligned_partial_ratio is above the threshold.
+    A multi-threaded rapidfuzz similarity matrix (cdist) first discards the pairs that cannot
+    be above it; only the remaining pairs are scored with aligned_partial_ratio.
+    Returns (list of categories or None, array of the scores of those categories, 0 if none).
+    """
+    queries = [ingredient.lower() for ingredient in ingredients]
+    choices = [category.lower() for category in ingredients_categories]
+    categories = []
+    scores = np.zeros(len(queries), dtype=np.float32)
+    blocks = range(0, len(queries), MATCH_BLOCK_SIZE)
+    for start in tqdm(blocks, desc="Matching ingredients") if progress else blocks:
+        block = process.cdist(queries[start:start + MATCH_BLOCK_SIZE], choices, scorer=fuzz.partial_ratio,
+                              score_cutoff=threshold, dtype=np.float32, workers=workers)
+        for row, candidates in enumerate(block):
+            query = queries[start + row]
+            category = None
+            for i in np.flatnonzero(candidates):
+                score = aligned_partial_ratio(query, choices[i])
+                if score > threshold:
+                    category = ingredients_categories[i]
+                    scores[start + row] = score
+                    break
+            categories.append(category)
+    return categories, scores
 
 # Function to fuzzy match and map ingredients to the 30 categories
 def map_to_category_fuzzy(ingredient):
-    ingredient = ingredient.lower()
-    for category in ingredients_categories:
-        if fuzz.partial_ratio(ingredient, category.lower()) > 80:  # You can adjust the threshold
-            return category
-    return None  # Return None if no match is found
+    return match_categories([ingredient])[0][0]
 
-# Load the dataset
-file_path = "data/processed_recipes.csv"
-df = pd.read_csv(file_path)
+def split_ingredients(ingredients):
+    """Splits an ingredients string the way the recipes are processed (unchanged from the first version)."""
+    return ingredients.split(",") if isinstance(ingredients, str) else []
 
-# Enable the progress bar
-tqdm.pandas(desc="Processing Ingredients")
+def normalize_ingredient(ingredient):
+    """Key of an ingredient string in the mapping table."""
+    return ingredient.strip().lower()
 
-# Process the ingredients: split them into a list and apply fuzzy matching with a progress bar
-df["ingredients_list"] = df["ingredients"].apply(lambda x: x.split(",") if isinstance(x, str) else [])
-df["category_list_fuzzy"] = df["ingredients_list"].progress_apply(lambda x: [map_to_category_fuzzy(ingredient.strip()) for ingredient in x])
+def load_ingredient_mapping(path=mapping_file):
+    """
+    Loads the ingredient -> category table (None for unmatched strings).
+    The table is discarded if it was built with other categories, another threshold or another scorer.
+    """
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if (stored.get("categories") != ingredients_categories or stored.get("threshold") != MATCH_THRESHOLD
+            or stored.get("scorer") != MATCH_SCORER):
+        return {}
+    return stored["mapping"]
 
-# Filter rows that have at least one category from the 30 ingredients
-df_filtered = df[df["category_list_fuzzy"].apply(lambda x: any(category is not None for category in x))]
+def save_ingredient_mapping(mapping, path=mapping_file):
+    """Writes the table atomically (temporary file + rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"categories": ingredients_categories, "threshold": MATCH_THRESHOLD, "scorer": MATCH_SCORER,
+                   "mapping": mapping}, f)
+    os.replace(tmp_path, path)
 
-# Print some information about the progress
-print(f"Processed {len(df)} rows.")
-print(f"Filtered {len(df_filtered)} rows with at least one matched ingredient.")
+def update_ingredient_mapping(mapping, ingredients, progress=False):
+    """Fuzzy-matches only the distinct strings that are not in the table yet. Returns how many were added."""
+    new_ingredients = sorted({normalize_ingredient(ingredient) for ingredient in ingredients} - mapping.keys())
+    categories, _ = match_categories(new_ingredients, progress=progress)
+    mapping.update(zip(new_ingredients, categories))
+    return len(new_ingredients)
 
-# Save the updated dataframe with the category list to a new CSV
-output_file = "data/processed_recipes_with_categories.csv"
-df_filtered.to_csv(output_file, index=False)
+def unique_ingredients(ingredients_column):
+    """Distinct ingredient strings of a Series of ingredients strings."""
+    return {normalize_ingredient(ingredient) for ingredients in ingredients_column for ingredient in split_ingredients(ingredients)}
+
+def categorize_recipes(df, mapping=None, progress=False):
+    """
+    Splits the ingredients of each recipe, maps them to the 30 categories with a dictionary
+    lookup in the mapping table and keeps the recipes with at least one matched ingredient.
+    Strings missing from the table are fuzzy-matched (and added to it).
+    """
+    mapping = {} if mapping is None else mapping
+    df["ingredients_list"] = df["ingredients"].apply(split_ingredients)
+    update_ingredient_mapping(mapping, chain.from_iterable(df["ingredients_list"]), progress=progress)
+
+    df["category_list_fuzzy"] = [[mapping[normalize_ingredient(ingredient)] for ingredient in ingredients]
+                                 for ingredients in df["ingredients_list"]]
+
+    # Filter rows that have at least one category from the 30 ingredients
+    return df[df["category_list_fuzzy"].apply(lambda x: any(category is not None for category in x))]
+
+def process_ingredients(input_path=file_path, output_path=output_file, mapping_path=mapping_file, stream=False,
+                        max_memory_mb=DEFAULT_MAX_MEMORY_MB, workers=None):
+    """
+    Build stage: processed_recipes.csv -> processed_recipes_with_categories.csv.
+    Returns the number of recipes with at least one matched ingredient.
+    """
+    # Fuzzy-match only the strings that are not in the mapping table yet
+    mapping = load_ingredient_mapping(mapping_path)
+    if stream:
+        ingredients = set()
+        # Chunks sized from the memory budget like the second pass (one reader, no workers)
+        chunksize = estimate_chunksize(input_path, max_memory_mb, 1)
+        for chunk in pd.read_csv(input_path, usecols=["ingredients"], chunksize=chunksize):
+            ingredients |= unique_ingredients(chunk["ingredients"])
+    else:
+        df = pd.read_csv(input_path)
+        ingredients = unique_ingredients(df["ingredients"])
+    added = update_ingredient_mapping(mapping, ingredients, progress=True)
+    save_ingredient_mapping(mapping, mapping_path)
+    print(f"{len(ingredients)} distinct ingredients, {added} new ones fuzzy-matched.")
+
+    if stream:
+        return process_csv_in_chunks(input_path, output_path, partial(categorize_recipes, mapping=mapping),
+                                     max_memory_mb=max_memory_mb, workers=workers)
+
+    # Process the ingredients: split them into a list and map them with the table
+    df_filtered = categorize_recipes(df, mapping)
+
+    # Print some information about the progress
+    print(f"Processed {len(df)} rows.")
+
+    # Save the updated dataframe with the category list to a new CSV
+    df_filtered.to_csv(output_path, index=False)
+    return len(df_filtered)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Map the recipe ingredients to the 30 detected categories.")
+    parser.add_argument("--stream", action="store_true", help="process the CSV in chunks with bounded memory")
+    parser.add_argument("--max-memory-mb", type=int, default=DEFAULT_MAX_MEMORY_MB)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args()
 
-print(f"Updated CSV with filtered ingredients saved to {output_file}")
+    rows = process_ingredients(stream=args.stream, max_memory_mb=args.max_memory_mb, workers=args.workers)
+    print(f"Filtered {rows} rows with at least one matched ingredient.")
+    print(f"Updated CSV with filtered ingredients saved to {output_file}")
@@ -1,9 +1,17 @@
 import pandas as pd
+import numpy as np
 import ast
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from helpers.chunked_pipeline import process_csv_in_chunks, DEFAULT_MAX_MEMORY_MB
 
-# Load dataset
+# Dataset paths
 file_path = "data/RAW_recipes.csv"
-df = pd.read_csv(file_path)
+output_file = "data/processed_recipes.csv"
+
+# Output order: by Nutri-Score (missing scores last), ties by recipe id
+sort_columns = ["nutriscore", "id"]
 
 # Define daily reference values for PDV conversion
 daily_values = {
@@ -15,7 +23,20 @@ daily_values = {
     "carbohydrates": 260,   # grams per day
 }
 
-# Function to convert PDV to absolute amount
+# Order of the values in the "nutrition" column of RAW_recipes.csv
+nutrition_columns = [
+    "calories", "total_fat_PDV", "sugar_PDV", "sodium_PDV",
+    "protein_PDV", "saturated_fat_PDV", "carbohydrates_PDV",
+]
+
+# Nutri-Score thresholds: the number of thresholds strictly below a value gives its points
+energy_thresholds = [335, 670, 1005, 1340, 1675, 2010, 2345, 2680, 3015, 3350]
+sugars_thresholds = [4.5, 9, 13.5, 18, 22.5, 27, 31, 36, 40, 45]
+satfat_thresholds = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+sodium_thresholds = [90, 180, 270, 360, 450, 540, 630, 720, 810, 900]
+protein_thresholds = [1.6, 3.2, 4.8, 6.4, 8.0]
+
+# Function to convert PDV to absolute amount (works on scalars and arrays)
 def convert_pdv_to_amount(pdv, nutrient):
     return (pdv / 100) * daily_values[nutrient]
 
@@ -35,73 +56,139 @@ def extract_nutrition(nutrition_str):
     except:
         return None  # Return None if there's an error
 
-# Apply extraction to dataset
-nutrition_data = df["nutrition"].apply(extract_nutrition)
-nutrition_df = pd.DataFrame(nutrition_data.tolist())
-
-# Merge extracted columns back into dataset
-df = pd.concat([df, nutrition_df], axis=1)
-
-# Convert PDV percentages to absolute values per 100g
-df["total_fat"] = df["total_fat_PDV"].apply(lambda x: convert_pdv_to_amount(x, "total_fat") if pd.notna(x) else None)
-df["sugar"] = df["sugar_PDV"].apply(lambda x: convert_pdv_to_amount(x, "sugar") if pd.notna(x) else None)
-df["sodium"] = df["sodium_PDV"].apply(lambda x: convert_pdv_to_amount(x, "sodium") if pd.notna(x) else None)
-df["protein"] = df["protein_PDV"].apply(lambda x: convert_pdv_to_amount(x, "protein") if pd.notna(x) else None)
-df["saturated_fat"] = df["saturated_fat_PDV"].apply(lambda x: convert_pdv_to_amount(x, "saturated_fat") if pd.notna(x) else None)
+def parse_nutrition(nutrition):
+    """
+    Bulk version of extract_nutrition: parses the "[a, b, ...]" strings into a float
+    DataFrame with one column per nutrient. Rows that cannot be parsed are all NaN.
+    """
+    parts = nutrition.str.strip().str.strip("[]").str.split(",", expand=True)
+    parsed = pd.DataFrame(index=nutrition.index, columns=nutrition_columns, dtype=float)
+    if parts.shape[1] < len(nutrition_columns):
+        return parsed
+    values = parts.iloc[:, :len(nutrition_columns)].apply(pd.to_numeric, errors="coerce")
+    values.columns = nutrition_columns
+    # Same as extract_nutrition: a row is kept only if all its values are valid
+    valid = values.notna().all(axis=1)
+    parsed.loc[valid] = values.loc[valid]
+    return parsed
 
 # Nutri-Score calculation functions
 def energy_points(energy):
-    thresholds = [335, 670, 1005, 1340, 1675, 2010, 2345, 2680, 3015, 3350]
-    return next((i for i, threshold in enumerate(thresholds) if energy <= threshold), 10)
+    return next((i for i, threshold in enumerate(energy_thresholds) if energy <= threshold), 10)
 
 def sugars_points(sugars):
-    thresholds = [4.5, 9, 13.5, 18, 22.5, 27, 31, 36, 40, 45]
-    return next((i for i, threshold in enumerate(thresholds) if sugars <= threshold), 10)
+    return next((i for i, threshold in enumerate(sugars_thresholds) if sugars <= threshold), 10)
 
 def satfat_points(sat_fat):
-    thresholds = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-    return next((i for i, threshold in enumerate(thresholds) if sat_fat <= threshold), 10)
+    return next((i for i, threshold in enumerate(satfat_thresholds) if sat_fat <= threshold), 10)
 
 def sodium_points(sodium):
-    thresholds = [90, 180, 270, 360, 450, 540, 630, 720, 810, 900]
-    return next((i for i, threshold in enumerate(thresholds) if sodium <= threshold), 10)
+    return next((i for i, threshold in enumerate(sodium_thresholds) if sodium <= threshold), 10)
 
 def protein_points(protein):
-    thresholds = [1.6, 3.2, 4.8, 6.4, 8.0]
-    return next((i for i, threshold in enumerate(thresholds) if protein <= threshold), 5)
-
-def calculate_nutriscore(energy, sugars, sat_fat, sodium, protein):
-    if pd.isna(energy) or pd.isna(sugars) or pd.isna(sat_fat) or pd.isna(sodium) or pd.isna(protein):
-        return None, None  # Return None if missing values
-    
-    neg_points = energy_points(energy) + sugars_points(sugars) + satfat_points(sat_fat) + sodium_points(sodium)
-    pos_points = protein_points(protein)
-
-    final_score = neg_points - pos_points
+    return next((i for i, threshold in enumerate(protein_thresholds) if protein <= threshold), 5)
 
+def grade_from_score(final_score):
     if final_score <= -1:
-        grade = "A"
+        return "A"
     elif 0 <= final_score <= 2:
-        grade = "B"
+        return "B"
     elif 3 <= final_score <= 10:
-        grade = "C"
+        return "C"
     elif 11 <= final_score <= 18:
-        grade = "D"
-    else:
-        grade = "E"
-
-    return final_score, grade
+        return "D"
+    return "E"
 
-# Apply Nutri-Score calculation
-df["nutriscore"], df["grade"] = zip(*df.apply(lambda row: calculate_nutriscore(
-    row["calories"], row["sugar"], row["saturated_fat"], row["sodium"], row["protein"]
-), axis=1))
-
-# Sort by nutriscore in descending order
-df = df.sort_values(by="nutriscore", ascending=True)
+def calculate_nutriscore(energy, sugars, sat_fat, sodium, protein):
+    if pd.isna(energy) or pd.isna(sugars) or pd.isna(sat_fat) or pd.isna(sodium) or pd.isna(protein):
+        return None, None  # Return None if missing values
 
-# Save to new CSV
-output_file = "data/processed_recipes.csv"
-df.to_csv(output_file, index=False)
+    neg_points = energy_points(energy) + sugars_points(sugars) + satfat_points(sat_fat) + sodium_points(sodium)
+    pos_points = protein_points(protein)
 
-print(f"Processed dataset saved to {output_file} (sorted by descending Nutri-Score)")
+    final_score = neg_points - pos_points
+    return final_score, grade_from_score(final_score)
+
+def points(values, thresholds):
+    """Vectorized *_points: number of thresholds strictly below each value."""
+    return np.searchsorted(np.asarray(thresholds, dtype=float), values, side="left")
+
+def calculate_nutriscores(energy, sugars, sat_fat, sodium, protein):
+    """
+    Vectorized calculate_nutriscore over arrays.
+    Returns (scores as float array with NaN for missing values, grades as object array with None).
+    """
+    energy, sugars, sat_fat, sodium, protein = (np.asarray(v, dtype=float) for v in (energy, sugars, sat_fat, sodium, protein))
+    missing = np.isnan(energy) | np.isnan(sugars) | np.isnan(sat_fat) | np.isnan(sodium) | np.isnan(protein)
+
+    neg_points = points(energy, energy_thresholds) + points(sugars, sugars_thresholds) \
+        + points(sat_fat, satfat_thresholds) + points(sodium, sodium_thresholds)
+    scores = (neg_points - points(protein, protein_thresholds)).astype(float)
+
+    grades = np.select(
+        [scores <= -1, scores <= 2, scores <= 10, scores <= 18],
+        ["A", "B", "C", "D"],
+        default="E",
+    ).astype(object)
+    scores[missing] = np.nan
+    grades[missing] = None
+    return scores, grades
+
+def compute_nutriscores(df):
+    """
+    Adds the nutrition columns, the absolute amounts and the Nutri-Score (nutriscore, grade)
+    to a RAW_recipes DataFrame. Same output as the former row-wise script, without Python loops.
+    """
+    df = pd.concat([df, parse_nutrition(df["nutrition"])], axis=1)
+
+    # Convert PDV percentages to absolute values per 100g
+    for nutrient in ["total_fat", "sugar", "sodium", "protein", "saturated_fat"]:
+        df[nutrient] = convert_pdv_to_amount(df[nutrient + "_PDV"], nutrient)
+
+    scores, grades = calculate_nutriscores(
+        df["calories"], df["sugar"], df["saturated_fat"], df["sodium"], df["protein"]
+    )
+    # Nullable integers, so that the output has the same format in memory and in streaming
+    # mode (every chunk), whether or not some scores are missing
+    df["nutriscore"] = pd.array(scores, dtype="Int64")
+    df["grade"] = grades
+    return df
+
+def process_recipes_streaming(input_path=file_path, output_path=output_file,
+                              max_memory_mb=DEFAULT_MAX_MEMORY_MB, workers=None):
+    """Chunked, multi-process version of the script below, with an external merge for the sort."""
+    return process_csv_in_chunks(input_path, output_path, compute_nutriscores, sort_by=sort_columns,
+                                 max_memory_mb=max_memory_mb, workers=workers)
+
+def process_recipes(input_path=file_path, output_path=output_file, stream=False,
+                    max_memory_mb=DEFAULT_MAX_MEMORY_MB, workers=None):
+    """
+    Build stage: RAW_recipes.csv -> processed_recipes.csv (with Nutri-Score, sorted by nutriscore).
+    Returns the number of recipes written.
+    """
+    if stream:
+        return process_recipes_streaming(input_path, output_path, max_memory_mb, workers)
+
+    # Load dataset
+    df = pd.read_csv(input_path)
+
+    # Apply Nutri-Score calculation
+    df = compute_nutriscores(df)
+
+    # Sort by nutriscore (best first), ties by id, as the streaming merge does
+    df = df.sort_values(by=sort_columns, ascending=True, kind="stable")
+
+    # Save to new CSV
+    df.to_csv(output_path, index=False)
+    return len(df)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compute the Nutri-Score of the raw recipes.")
+    parser.add_argument("--stream", action="store_true", help="process the CSV in chunks with bounded memory")
+    parser.add_argument("--max-memory-mb", type=int, default=DEFAULT_MAX_MEMORY_MB)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args()
+
+    rows = process_recipes(stream=args.stream, max_memory_mb=args.max_memory_mb, workers=args.workers)
+    print(f"Processed {rows} recipes, saved to {output_file} (sorted by descending Nutri-Score)")
@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Source CSV produced by ingredients.py and the columnar catalog built from it.
+CSV_FILE = "data/processed_recipes_with_categories.csv"
+CATALOG_FILE = "data/recipe_catalog.parquet"
+
+# Columns the app actually reads; everything else stays in the CSV.
+CATALOG_COLUMNS = [
+    "id", "name", "minutes", "description", "ingredients_list", "n_ingredients",
+    "calories", "total_fat_PDV", "sugar_PDV", "sodium_PDV", "protein_PDV",
+    "saturated_fat_PDV", "carbohydrates_PDV", "nutriscore", "grade",
+    "ingredient_mask",
+]
+
+# The 30 ingredient categories detected by the fine-tuned YOLO model: the single definition,
+# also used by ingredients.py to label the CSV. The position of a category is its bit in the recipe masks.
+INGREDIENT_CATEGORIES = [
+    "apple", "banana", "beef", "blueberries", "bread", "butter", "carrot",
+    "cheese", "chicken", "chicken_breast", "chocolate", "corn", "eggs",
+    "flour", "goat_cheese", "green_beans", "ground_beef", "ham", "heavy_cream",
+    "lime", "milk", "mushrooms", "onion", "potato", "shrimp", "spinach",
+    "strawberries", "sugar", "sweet_potato", "tomato"
+]
+
+# Whole-word patterns (singular and plural) so that e.g. "corn" no longer matches "cornstarch".
+CATEGORY_PATTERNS = {
+    "apple": r"\bapples?\b",
+    "banana": r"\bbananas?\b",
+    "beef": r"\bbeef\b",
+    "blueberries": r"\bblueberr(?:y|ies)\b",
+    "bread": r"\bbreads?\b",
+    "butter": r"\bbutter\b",
+    "carrot": r"\bcarrots?\b",
+    "cheese": r"\bcheeses?\b",
+    "chicken": r"\bchicken\b",
+    "chicken_breast": r"\bchicken breasts?\b",
+    "chocolate": r"\bchocolate\b",
+    "corn": r"\bcorn\b",
+    "eggs": r"\beggs?\b",
+    "flour": r"\bflour\b",
+    "goat_cheese": r"\bgoat cheese\b",
+    "green_beans": r"\bgreen beans?\b",
+    "ground_beef": r"\bground beef\b",
+    "ham": r"\bham\b",
+    "heavy_cream": r"\bheavy cream\b",
+    "lime": r"\blimes?\b",
+    "milk": r"\bmilk\b",
+    "mushrooms": r"\bmushrooms?\b",
+    "onion": r"\bonions?\b",
+    "potato": r"\bpotato(?:es)?\b",
+    "shrimp": r"\bshrimps?\b",
+    "spinach": r"\bspinach\b",
+    "strawberries": r"\bstrawberr(?:y|ies)\b",
+    "sugar": r"\bsugar\b",
+    "sweet_potato": r"\bsweet potato(?:es)?\b",
+    "tomato": r"\btomato(?:es)?\b",
+}
+
+def build_ingredient_masks(ingredients):
+    """
+    Builds one uint32 bitmask per recipe from its ingredients string.
+    Bit i is set when the recipe contains INGREDIENT_CATEGORIES[i].
+    """
+    ingredients = ingredients.fillna("").str.lower()
+    masks = np.zeros(len(ingredients), dtype=np.uint32)
+    for bit, category in enumerate(INGREDIENT_CATEGORIES):
+        has_category = ingredients.str.contains(CATEGORY_PATTERNS[category], regex=True).to_numpy(dtype=bool)
+        masks |= has_category.astype(np.uint32) << np.uint32(bit)
+    return masks
+
+def build_catalog(csv_path=CSV_FILE, catalog_path=CATALOG_FILE):
+    """
+    Parses the recipes CSV once, adds the ingredient bitmask column
+    and writes the columns used by the app to a Parquet file.
+    """
+    df = pd.read_csv(csv_path)
+    df["ingredient_mask"] = build_ingredient_masks(df["ingredients"])
+    df = df[CATALOG_COLUMNS].reset_index(drop=True)
+
+    # Write to a temporary file first so a crash never leaves a truncated catalog.
+    tmp_path = catalog_path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, catalog_path)
+    return df
+
+def catalog_is_stale(csv_path=CSV_FILE, catalog_path=CATALOG_FILE):
+    """The catalog must be rebuilt if it is missing or older than the CSV."""
+    if not os.path.exists(catalog_path):
+        return True
+    return os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(catalog_path)
+
+@lru_cache(maxsize=1)
+def load_catalog():
+    """
+    Returns the recipe catalog, shared by every module of the process.
+    The Parquet file is (re)built from the CSV only when it is stale.
+    """
+    if catalog_is_stale():
+        return build_catalog()
+    return pd.read_parquet(CATALOG_FILE)
+
+if __name__ == "__main__":
+    catalog = build_catalog()
+    print(f"Recipe catalog with {len(catalog)} recipes saved to {CATALOG_FILE}")
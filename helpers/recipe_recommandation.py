@@ -1,11 +1,61 @@
 import pandas as pd
+import numpy as np
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from PIL import Image
 from io import BytesIO
 
-# Load the CSV data containing recipes.
-food_data = pd.read_csv(r'data/processed_recipes_with_categories.csv')
+from helpers.recipe_catalog import load_catalog, INGREDIENT_CATEGORIES
+from helpers.image_cache import MISS, get_cached_image_url, get_cached_image_urls, set_cached_image_url, purge_expired
+
+RECIPE_BASE_URL = "https://www.food.com/recipe/"
+
+# Per-request timeout (seconds) and size of the shared connection pool to Food.com.
+REQUEST_TIMEOUT = 5
+MAX_WORKERS = 8
+
+# Shared session so that connections (and TLS handshakes) are reused across requests.
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS))
+
+# Load the recipe catalog (shared with pages/alimentation.py).
+food_data = load_catalog()
+
+# Recipe id -> name, for O(1) lookups when building Food.com URLs.
+recipe_names = pd.Series(food_data['name'].to_numpy(), index=food_data['id'].to_numpy())
+
+def ingredients_to_mask(ingredients_list):
+    """
+    Converts a list of category names into a query bitmask.
+    Names outside INGREDIENT_CATEGORIES are ignored.
+    """
+    mask = 0
+    for ingredient in ingredients_list:
+        ingredient = ingredient.lower().strip().replace(" ", "_")
+        if ingredient in INGREDIENT_CATEGORIES:
+            mask |= 1 << INGREDIENT_CATEGORIES.index(ingredient)
+    return np.uint32(mask)
+
+# Bitmasks precomputed by recipe_catalog, so a query is a single AND + popcount over the catalog.
+ingredient_masks = food_data['ingredient_mask'].to_numpy(dtype=np.uint32)
+# Number of ingredient categories of each recipe (at least 1, to divide by it).
+recipe_category_counts = np.maximum(np.bitwise_count(ingredient_masks), 1).astype(np.float32)
+
+# Weights of the ranking criteria used by recommend_recipes.
+RANKING_WEIGHTS = {
+    "matches": 1.0,     # number of selected ingredients used by the recipe
+    "coverage": 1.0,    # share of the recipe's ingredient categories found in the selection
+    "grade": 0.5,       # Nutri-Score grade (A best, E worst)
+    "calories": 0.5,    # fit to the calories left for today
+}
+
+GRADE_SCORES = {"A": 1.0, "B": 0.75, "C": 0.5, "D": 0.25, "E": 0.0}
+
+# Per-recipe arrays used for scoring, aligned with food_data rows.
+grade_scores = food_data['grade'].map(GRADE_SCORES).fillna(0.0).to_numpy(dtype=np.float32)
+recipe_calories = food_data['calories'].fillna(0.0).to_numpy(dtype=np.float32)
 
 def get_primary_image_url(html_content):
     """
@@ -19,26 +69,73 @@ def get_primary_image_url(html_content):
             return img_tag['src']
     return None
 
+def fetch_food_image_url(food_id, food_name):
+    """
+    Downloads the Food.com page of a recipe and returns its primary image URL (None if there is none).
+    Network errors are raised so that they are not cached as misses.
+    """
+    # Construct the URL based on the recipe name and id.
+    url = RECIPE_BASE_URL + str(food_name).replace(" ", "-") + "-" + str(food_id)
+    response = http_session.get(url, timeout=REQUEST_TIMEOUT)
+
+    if response.status_code == 200:
+        return get_primary_image_url(response.text)
+    return None
+
 def get_food_image_url(food_id):
     """
     Given a food ID, this function finds the corresponding recipe name in the CSV data,
     constructs the URL for that recipe on Food.com, and then returns the primary image URL.
+    Results (including misses) are kept in the persistent image cache.
     """
-    try:
-        food_name = food_data.loc[food_data['id'] == food_id, 'name'].values[0]
-    except IndexError:
-        return None
-
-    # Construct the URL based on the recipe name and id.
-    url = "https://www.food.com/recipe/" + str(food_name).replace(" ", "-") + "-" + str(food_id)
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        image_url = get_primary_image_url(response.text)
+    image_url = get_cached_image_url(food_id)
+    if image_url is not MISS:
         return image_url
-    else:
+
+    food_name = recipe_names.get(food_id)
+    if food_name is None:
         return None
 
+    try:
+        image_url = fetch_food_image_url(food_id, food_name)
+    except requests.RequestException:
+        return None  # Transient error: try again on the next call
+    set_cached_image_url(food_id, image_url)
+    return image_url
+
+def resolve_and_cache_image_url(food_id):
+    """Fetches the image URL of a recipe and stores it in the cache."""
+    image_url = fetch_food_image_url(food_id, recipe_names[food_id])
+    set_cached_image_url(food_id, image_url)
+    return image_url
+
+def get_food_image_urls(food_ids, deadline=8.0):
+    """
+    Batch version of get_food_image_url: returns {food_id: image URL or None}.
+    Uncached recipes are fetched concurrently through the shared session.
+    When the deadline (seconds, None for no deadline) is reached, the URLs resolved so far are returned;
+    the pending requests keep running in the background and fill the cache.
+    """
+    food_ids = [int(food_id) for food_id in food_ids]
+    cached = get_cached_image_urls(food_ids)
+    image_urls = dict.fromkeys(food_ids)
+    image_urls.update(cached)
+
+    to_fetch = [food_id for food_id in food_ids if food_id not in cached and food_id in recipe_names.index]
+    if not to_fetch:
+        return image_urls
+
+    executor = ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(to_fetch)))
+    futures = {executor.submit(resolve_and_cache_image_url, food_id): food_id for food_id in to_fetch}
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            if future.exception() is None:
+                image_urls[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        pass
+    executor.shutdown(wait=False)
+    return image_urls
+
 def show_food_image(food_id):
     """
     Downloads and displays the food image using the recipe id.
@@ -54,16 +151,83 @@ def show_food_image(food_id):
 def propose_recipes(ingredients_list):
     """
     Returns recipes from the CSV that contain at least 3 matching ingredients.
-    Both the input and the recipe ingredients are compared in lowercase.
-    """
-    # Normalize user-selected ingredients.
-    ingredients_list = [ingredient.lower() for ingredient in ingredients_list]
-    
-    def count_matching_ingredients(recipe_ingredients):
-        # 'recipe_ingredients' is expected to be a string (from the CSV).
-        return sum(1 for ingredient in ingredients_list if ingredient in recipe_ingredients)
-    
+    Matching uses the precomputed category bitmasks (see recipe_catalog.build_ingredient_masks).
+    """
+    query_mask = ingredients_to_mask(ingredients_list)
+
+    # Number of selected categories present in each recipe (vectorized AND + popcount).
+    match_counts = np.bitwise_count(ingredient_masks & query_mask)
+
     # Filter recipes: here we require at least 3 matching ingredients.
-    matching_recipes = food_data[food_data['ingredients'].apply(lambda x: count_matching_ingredients(x.lower())) >= 3]
-    
+    matching_recipes = food_data[match_counts >= 3]
+
     return matching_recipes
+
+
+def calorie_fit(calories, remaining_calories):
+    """
+    1 for recipes within the remaining calorie budget, decreasing linearly to 0
+    when the recipe exceeds the budget by 100% or more.
+    """
+    if not remaining_calories or remaining_calories <= 0:
+        return np.zeros_like(calories)
+    excess = np.maximum(calories - remaining_calories, 0) / remaining_calories
+    return np.clip(1 - excess, 0, 1)
+
+def recommend_recipes(ingredients_list, k=10, remaining_calories=None, min_matches=3):
+    """
+    Returns the k best recipes for the selected ingredients, best first.
+    Recipes are ranked by match count, share of the recipe covered by the selection, Nutri-Score
+    grade and fit to the remaining calories (see RANKING_WEIGHTS).
+    Only the k selected rows of the catalog are materialized.
+    """
+    query_mask = ingredients_to_mask(ingredients_list)
+    if query_mask == 0:
+        return food_data.iloc[0:0]
+
+    match_counts = np.bitwise_count(ingredient_masks & query_mask)
+    candidates = np.flatnonzero(match_counts >= min_matches)
+    if len(candidates) == 0:
+        return food_data.iloc[0:0]
+
+    # Score only the candidate recipes.
+    matches = match_counts[candidates].astype(np.float32)
+    scores = (RANKING_WEIGHTS["matches"] * matches
+              + RANKING_WEIGHTS["coverage"] * matches / recipe_category_counts[candidates]
+              + RANKING_WEIGHTS["grade"] * grade_scores[candidates]
+              + RANKING_WEIGHTS["calories"] * calorie_fit(recipe_calories[candidates], remaining_calories))
+
+    # Partial selection of the top k, then sort only those k (ties keep catalog order).
+    # The recipes tied at the k-th score are taken in catalog order, not as argpartition leaves them.
+    if len(candidates) > k:
+        kth_score = np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(-scores < kth_score)
+        tied = np.flatnonzero(-scores == kth_score)[:k - len(above)]
+        top = np.concatenate([above, tied])
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.lexsort((candidates[top], -scores[top]))]
+
+    top_recipes = food_data.iloc[candidates[top]].copy()
+    top_recipes['match_count'] = match_counts[candidates[top]]
+    top_recipes['score'] = scores[top]
+    return top_recipes
+
+def warm_image_cache(n_recipes=500):
+    """
+    Pre-resolves the image URLs of the recipes most likely to be recommended:
+    the best Nutri-Scores among recipes with at least 3 ingredient categories.
+    Uncached recipes are fetched concurrently by get_food_image_urls, without deadline.
+    """
+    likely = np.flatnonzero(np.bitwise_count(ingredient_masks) >= 3)
+    likely = likely[np.argsort(food_data['nutriscore'].to_numpy()[likely], kind='stable')][:n_recipes]
+    image_urls = get_food_image_urls(food_data['id'].to_numpy()[likely], deadline=None)
+    return sum(1 for image_url in image_urls.values() if image_url)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Purge the expired entries of the image cache and pre-resolve recipe image URLs.")
+    parser.add_argument("--warm", type=int, default=500, help="number of recipes to resolve")
+    args = parser.parse_args()
+    print(f"Purged {purge_expired()} expired image cache entries")
+    print(f"Resolved {warm_image_cache(args.warm)} image URLs out of {args.warm} recipes")
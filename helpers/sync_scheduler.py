@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from helpers.database import init_db, query, transaction
+from helpers.garmin_sync import sync_user
+from helpers.garmin_backfill import resume_backfills
+
+# Time between two syncs of the same account, in seconds
+SYNC_INTERVAL = 30 * 60
+# Accounts synced at the same time (the Garmin requests are also globally rate limited)
+MAX_CONCURRENT_SYNCS = 4
+# How often the scheduler looks for due accounts, in seconds
+POLL_SECONDS = 15
+# Backoff after consecutive failures of an account: 1 min, 2 min, 4 min... up to 6 h
+BACKOFF_BASE = 60
+BACKOFF_MAX = 6 * 60 * 60
+# A sync still "running" after this long was interrupted (crash, restart) and can be retried
+STALE_RUNNING = 30 * 60
+# Set SYNC_SCHEDULER=0 to not start the scheduler in the Streamlit process
+# (e.g. when it runs in its own process: python -m helpers.sync_scheduler)
+SYNC_SCHEDULER = os.getenv("SYNC_SCHEDULER", "1") != "0"
+
+_scheduler_thread = None
+_scheduler_stop = threading.Event()
+_scheduler_lock = threading.Lock()
+
+def timestamp(moment=None):
+    return (moment or datetime.now()).isoformat(timespec="seconds")
+
+def backoff_seconds(failures):
+    """Delay before retrying an account after `failures` consecutive failures."""
+    return min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX)
+
+def get_sync_status(user_id):
+    """Sync status of a user for the UI (dict), or None if the account was never synced."""
+    rows = query("""
+    SELECT status, last_synced_at, last_error, failures, next_sync_at
+    FROM garmin_sync WHERE user_id = ?
+    """, (user_id,))
+    if not rows:
+        return None
+    return dict(zip(["status", "last_synced_at", "last_error", "failures", "next_sync_at"], rows[0]))
+
+def request_sync(user_id):
+    """Makes an account due now: the scheduler syncs it at its next poll, without blocking the caller."""
+    with transaction() as cursor:
+        cursor.execute("""
+        INSERT INTO garmin_sync (user_id, next_sync_at) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET next_sync_at = excluded.next_sync_at
+        """, (user_id, timestamp()))
+
+def due_accounts(limit):
+    """Users with Garmin credentials whose next sync is due and that are not being synced."""
+    now = datetime.now()
+    return query("""
+    SELECT users.id, users.garmin_id, users.garmin_password
+    FROM users LEFT JOIN garmin_sync ON garmin_sync.user_id = users.id
+    WHERE users.garmin_id IS NOT NULL AND users.garmin_id != ''
+      AND users.garmin_password IS NOT NULL AND users.garmin_password != ''
+      AND (garmin_sync.next_sync_at IS NULL OR garmin_sync.next_sync_at <= ?)
+      AND (garmin_sync.status IS NOT 'running' OR garmin_sync.started_at < ?)
+    ORDER BY garmin_sync.next_sync_at
+    LIMIT ?
+    """, (timestamp(now), timestamp(now - timedelta(seconds=STALE_RUNNING)), limit))
+
+def claim_account(user_id):
+    """
+    Marks an account as running. Returns False if another scheduler (another process)
+    claimed it in the meantime.
+    """
+    now = datetime.now()
+    with transaction() as cursor:
+        cursor.execute("INSERT OR IGNORE INTO garmin_sync (user_id) VALUES (?)", (user_id,))
+        cursor.execute("""
+        UPDATE garmin_sync SET status = 'running', started_at = ?
+        WHERE user_id = ? AND (status IS NOT 'running' OR started_at < ?)
+        """, (timestamp(now), user_id, timestamp(now - timedelta(seconds=STALE_RUNNING))))
+        return cursor.rowcount == 1
+
+def record_success(user_id, interval=SYNC_INTERVAL):
+    with transaction() as cursor:
+        cursor.execute("""
+        UPDATE garmin_sync SET status = 'ok', last_error = NULL, failures = 0, next_sync_at = ?
+        WHERE user_id = ?
+        """, (timestamp(datetime.now() + timedelta(seconds=interval)), user_id))
+
+def record_failure(user_id, error):
+    with transaction() as cursor:
+        failures = cursor.execute("SELECT failures FROM garmin_sync WHERE user_id = ?", (user_id,)).fetchone()[0] + 1
+        cursor.execute("""
+        UPDATE garmin_sync SET status = 'error', last_error = ?, failures = ?, next_sync_at = ?
+        WHERE user_id = ?
+        """, (str(error) or type(error).__name__, failures,
+              timestamp(datetime.now() + timedelta(seconds=backoff_seconds(failures))), user_id))
+
+def sync_account(user_id, garmin_id, garmin_password, interval=SYNC_INTERVAL):
+    """Syncs one account and records the outcome in the status table. Never raises."""
+    try:
+        counts = sync_user(user_id, garmin_id, garmin_password)
+    except Exception as e:
+        print(f"Garmin sync of user {user_id} failed: {e}")
+        record_failure(user_id, e)
+        return None
+    record_success(user_id, interval)
+    return counts
+
+def run_scheduler(stop_event, interval=SYNC_INTERVAL, workers=MAX_CONCURRENT_SYNCS, poll=POLL_SECONDS, once=False):
+    """
+    Scheduler loop: every `poll` seconds, starts the syncs of the due accounts in a pool of
+    `workers` threads, never more than one sync per account. With once=True, returns
+    when the accounts due at start have been synced.
+    Also restarts the history backfills that a crash or restart interrupted.
+    """
+    init_db()
+    if not once:
+        resume_backfills()
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="garmin-sync") as executor:
+        while not stop_event.is_set():
+            for user_id in [user_id for user_id, future in in_flight.items() if future.done()]:
+                del in_flight[user_id]
+            try:
+                if len(in_flight) < workers:
+                    for user_id, garmin_id, garmin_password in due_accounts(workers - len(in_flight)):
+                        if user_id not in in_flight and claim_account(user_id):
+                            in_flight[user_id] = executor.submit(sync_account, user_id, garmin_id, garmin_password, interval)
+            except Exception as e:
+                # e.g. database locked for longer than the busy timeout: retry at the next poll
+                print(f"Garmin sync scheduler: {e}")
+            if once and not in_flight:
+                return
+            stop_event.wait(poll if not once else 0.1)
+
+def start_scheduler():
+    """
+    Starts the scheduler in a daemon thread, once per process (later calls do nothing).
+    Called by main.py so that the syncs never run in a page's script.
+    """
+    global _scheduler_thread
+    with _scheduler_lock:
+        if not SYNC_SCHEDULER or (_scheduler_thread is not None and _scheduler_thread.is_alive()):
+            return
+        _scheduler_thread = threading.Thread(target=run_scheduler, args=(_scheduler_stop,),
+                                             name="garmin-sync-scheduler", daemon=True)
+        _scheduler_thread.start()
+
+def stop_scheduler():
+    _scheduler_stop.set()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Sync the Garmin activities of all the users on a schedule.")
+    parser.add_argument("--interval", type=int, default=SYNC_INTERVAL, help="seconds between two syncs of an account")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_SYNCS, help="accounts synced at the same time")
+    parser.add_argument("--once", action="store_true", help="sync the due accounts once and exit")
+    args = parser.parse_args()
+
+    try:
+        run_scheduler(_scheduler_stop, args.interval, args.workers, once=args.once)
+    except KeyboardInterrupt:
+        stop_scheduler()
@@ -2,22 +2,29 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Import helper functions from our CSV-based recommendation module.
-from helpers.database import get_user, add_pdv, get_calories  # to fetch user info (as used in informations.py)
-from helpers.recipe_recommandation import propose_recipes, get_food_image_url
+from helpers.database import get_user, add_pdv, get_calories, get_pdv  # to fetch user info (as used in informations.py)
+from helpers.recipe_catalog import INGREDIENT_CATEGORIES
 
 import streamlit as st
 import pandas as pd
 from PIL import Image
 from datetime import datetime
-
-# Import our YOLO-based fridge analysis function from our custom module.
-from helpers.food_detection import analyse_frigo
-
-@st.cache_data
-def load_food_data():
-    return pd.read_csv(r'data/processed_recipes_with_categories.csv')
-
-food_data = load_food_data()
+import threading
+
+def preload_heavy_modules():
+    """
+    Imports the YOLO model (ultralytics, torch) and the recipe catalog in a background
+    thread, so that the page renders without waiting for them. The imports inside show()
+    reuse the modules once they are loaded.
+    """
+    def load():
+        from helpers.food_detection import get_model
+        import helpers.recipe_recommandation  # Loads the shared recipe catalog
+        get_model()
+    threading.Thread(target=load, daemon=True).start()
+
+# Module imported once per process, when the page is first opened.
+preload_heavy_modules()
 
 def calculate_bmr(weight, height, age, gender):
     """Calculates the Basal Metabolic Rate using the Mifflin-St Jeor equation."""
@@ -46,6 +53,11 @@ def get_daily_calories_from_garmin(user_id):
 
     return get_calories(user_id)
 
+def get_calories_eaten_today(user_id):
+    """Sums the calories of the recipes saved today in the nutrition plan."""
+    today = datetime.today().strftime("%Y-%m-%d")
+    return sum(entry[0] or 0 for entry in get_pdv(user_id) if str(entry[7]).startswith(today))
+
 def show():
     st.title("Show me the Food! I'll tell you what to eat 🍔🥗")
 
@@ -88,18 +100,13 @@ def show():
     if st.session_state.camera_active:
         camera_image = st.camera_input("Capture an image with your webcam or smartphone")
         if camera_image is not None:
-            temp_image_path = os.path.join("data", "fridge_images", "temp_captured.jpg")
-            with open(temp_image_path, "wb") as f:
-                f.write(camera_image.getbuffer())
-            detected_ingredients = analyse_frigo(temp_image_path)
+            from helpers.food_detection import analyse_frigo_cached
+            # Detection is memoized by image content, so reruns on the same photo are free
+            detected_ingredients, annotated_image = analyse_frigo_cached(camera_image.getvalue())
             st.write("Detected ingredients:", detected_ingredients)
 
             # Display the annotated image with bounding boxes
-            annotated_image_path = os.path.join("data", "fridge_images", "output", os.path.basename(temp_image_path))
-            if os.path.exists(annotated_image_path):
-                st.image(annotated_image_path, caption="Annotated Fridge Image", use_container_width=True)
-            else:
-                st.write("No image uploaded. You can manually select the ingredients.")
+            st.image(annotated_image, caption="Annotated Fridge Image", use_container_width=True)
     else:
         st.write("Camera is deactivated. Click 'Activate Camera' to start capturing.")
 
@@ -107,35 +114,17 @@ def show():
     uploaded_image = st.file_uploader("Or upload an image of your fridge", type=["jpg", "png", "jpeg"])
 
     if uploaded_image is not None:
-        temp_image_path = os.path.join("data", "fridge_images", "uploaded_image.jpg")
-        with open(temp_image_path, "wb") as f:
-            f.write(uploaded_image.getbuffer())
-        
-        # Perform fridge analysis on the uploaded image and get the bounding box data
-        detected_ingredients = analyse_frigo(temp_image_path)
+        from helpers.food_detection import analyse_frigo_cached
+        # Perform fridge analysis on the uploaded image (memoized by image content)
+        detected_ingredients, annotated_image = analyse_frigo_cached(uploaded_image.getvalue())
         st.write("Detected ingredients from uploaded image:", detected_ingredients)
 
-        # Annotate the uploaded image with bounding boxes and save it
-        annotated_image_path = os.path.join("data", "fridge_images", "output", "uploaded_image.jpg")
-        
-        # Assuming 'analyse_frigo' already draws the bounding boxes and saves the annotated image.
-        # If it doesn't, you may need to manually call the drawing function after detection.
-        
         # Display the annotated uploaded image with bounding boxes
-        if os.path.exists(annotated_image_path):
-            st.image(annotated_image_path, caption="Annotated Fridge Image (Uploaded)", width=450)
-        else:
-            st.write("No image processed. Something went wrong during the analysis.")
+        st.image(annotated_image, caption="Annotated Fridge Image (Uploaded)", width=450)
 
 
     # --- Ingredient Selection (Fixed List of 30) ---
-    ingredient_options = [
-        "apple", "banana", "beef", "blueberries", "bread", "butter", "carrot",
-        "cheese", "chicken", "chicken_breast", "chocolate", "corn", "eggs",
-        "flour", "goat_cheese", "green_beans", "ground_beef", "ham", "heavy_cream",
-        "lime", "milk", "mushrooms", "onion", "potato", "shrimp", "spinach",
-        "strawberries", "sugar", "sweet_potato", "tomato"
-    ]
+    ingredient_options = INGREDIENT_CATEGORIES
     
     # Preselect detected ingredients that are in our fixed list.
     default_selection = [ing for ing in detected_ingredients if ing in ingredient_options]
@@ -166,6 +155,7 @@ def show():
     else:
         daily_calories_burned = 0
     tdee = bmr + daily_calories_burned
+    remaining_calories = max(tdee - get_calories_eaten_today(user_id), 0)
     # Create a DataFrame for the nutritional information
     nutritional_data = {
         "Metric": ["BMR (Basal Metabolic Rate)", "Daily Calories Burned (Simulated Garmin)", "TDEE (Total Daily Energy Expenditure)"],
@@ -195,9 +185,10 @@ def show():
 
     if st.button("Find Recipes"):
         if selected_ingredients:
-            matching_recipes = propose_recipes(selected_ingredients)
-            if not matching_recipes.empty:
-                top_recipes = matching_recipes.head(10)  # Limit to top 10 recipes
+            from helpers.recipe_recommandation import recommend_recipes
+            # Top 10 recipes ranked by matches, coverage, Nutri-Score and remaining calories
+            top_recipes = recommend_recipes(selected_ingredients, k=10, remaining_calories=remaining_calories)
+            if not top_recipes.empty:
                 st.session_state.matching_recipes = top_recipes  # Save recipes in session state
                 st.write(f"Found a top-{len(top_recipes)} matching recipes!")
             else:
@@ -214,6 +205,9 @@ def show():
                 "D": "🟣 D",
                 "E": "🔴 E",
             }
+        from helpers.recipe_recommandation import get_food_image_urls
+        # Resolve all recipe images at once (cached, concurrent, bounded by a deadline)
+        image_urls = get_food_image_urls(st.session_state.matching_recipes["id"])
         for _, recipe in st.session_state.matching_recipes.iterrows():
             # Création de colonnes pour mieux organiser l'affichage
             col1, col2 = st.columns([2, 1])  # 2/3 pour image + infos, 1/3 pour ingrédients
@@ -223,7 +217,7 @@ def show():
             with col1:
                 # Lien cliquable sur l'image
                 st.write(f"🍽️ **{recipe['name']} {grade_emoji[grade]}**")
-                image_url = get_food_image_url(recipe["id"])  # Accessing the recipe's ID
+                image_url = image_urls.get(int(recipe["id"]))  # Accessing the recipe's ID
                 if image_url:
                     recipe_url = f"https://www.food.com/recipe/{recipe['name'].lower().replace(' ', '-')}-{recipe['id']}"  # Génère le lien vers la recette
                     st.markdown(f'<a href="{recipe_url}" target="_blank"><img src="{image_url}" alt="{recipe["name"]}" style="width:100%;"></a>', unsafe_allow_html=True)
@@ -1,9 +1,11 @@
 import streamlit as st
 import openai
-import sqlite3
 from datetime import datetime
 import os
+import sys
 from dotenv import load_dotenv
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from helpers.database import query
 
 
 # Charger les variables d'environnement
@@ -13,15 +15,10 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 
-DB_FILE = "data/users.db"
-
 def get_user_info(username):
     """Récupère les infos de l'utilisateur depuis la base de données."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT birth_date, weight, height, gender FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
+    rows = query("SELECT birth_date, weight, height, gender FROM users WHERE username = ?", (username,))
+    user = rows[0] if rows else None
 
     if user:
         birth_date, weight, height, gender = user
@@ -45,10 +42,7 @@ def get_user_info(username):
 
 def get_last_activities(username):
     """Récupère les 5 dernières activités de l'utilisateur."""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute("""
+    activities = query("""
     SELECT activity_name, start_time, calories, steps 
     FROM activities 
     JOIN users ON activities.user_id = users.id 
@@ -57,9 +51,6 @@ def get_last_activities(username):
     LIMIT 5
     """, (username,))
 
-    activities = cursor.fetchall()
-    conn.close()
-
     if activities:
         formatted_activities = "\n".join([
             f"- {activity[0]} on {activity[1]}: {activity[2]} calories, {activity[3]} steps"
@@ -1,17 +1,35 @@
 import streamlit as st
 import sys
 import os
+import time
 from datetime import datetime, timedelta
 import plotly.express as px
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Import helper functions from our CSV-based recommendation module.
-from helpers.database import get_user, get_poids, get_activities, get_pdv
+from helpers.database import get_dashboard_snapshot, get_data_version, DAILY_STATS_COLUMNS
 
 import pandas as pd
 import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 
+# Writes made by another process (e.g. a standalone sync scheduler) do not bump this process'
+# data versions: a cached snapshot is also refreshed after this many seconds
+SNAPSHOT_MAX_AGE = 60
+
+def load_snapshot(username, since):
+    """
+    Dashboard data of the user, cached in the session across reruns (chart interactions,
+    period changes back and forth) until a write bumps the user's data version.
+    """
+    cache = st.session_state.setdefault("dashboard_snapshots", {})
+    cached = cache.get((username, since))
+    if cached is not None and cached["version"] == get_data_version(cached["user"][0]) \
+            and time.monotonic() - cached["loaded_at"] < SNAPSHOT_MAX_AGE:
+        return cached
+    snapshot = get_dashboard_snapshot(username, since)
+    if snapshot is not None:
+        snapshot["loaded_at"] = time.monotonic()
+        cache[(username, since)] = snapshot
+    return snapshot
 
 def show():
 
@@ -38,26 +56,40 @@ def show():
     )
         
     username = st.session_state['user']
-    user_info = get_user(username)
-    
-    if not user_info:
+
+    # Days shown in the charts: only these rows of the daily summary are read
+    # (all the history by default, as before the period selector)
+    days_shown = st.selectbox("Period", [30, 90, 365, None], index=3,
+                              format_func=lambda days: f"Last {days} days" if days else "Since the beginning")
+    since = (datetime.today() - timedelta(days=days_shown - 1)).strftime("%Y-%m-%d") if days_shown else None
+
+    # Everything the dashboard shows, read in one transaction (no query while it is cached)
+    snapshot = load_snapshot(username, since)
+
+    if not snapshot:
         st.write('User not found.')
         return
 
-    user_id = user_info[0]  # Replace with actual user ID fetching logic
-    weight_data = get_poids(user_id)
-    activity_data = get_activities(username)  # Fetch activity data
-    pdv_data = get_pdv(user_id)  # Fetch PDV data for the user
-    
-    if not weight_data or not user_info:
+    user_info = snapshot["user"]
+    # Activities are synced in the background: only show when they were last updated
+    if snapshot["last_synced_at"]:
+        st.caption(f"Garmin activities last synced: {snapshot['last_synced_at']}")
+
+    if snapshot["last_weight"] is None:
         st.write("No weight data available.")
         return
-    
+
+    # One row per day: calories burned, steps, calories eaten, summed PDV per nutrient, last weight
+    daily_stats = pd.DataFrame(snapshot["daily_stats"], columns=["Date", *DAILY_STATS_COLUMNS])
+
     # Get today's date
     today = pd.to_datetime("today").strftime("%Y-%m-%d")
-    
-    # Filter PDV data for today's date
-    pdv_today = [entry for entry in pdv_data if entry[7].startswith(today)]  # Assuming date is the 8th element
+
+    # Today's summary (None if nothing was recorded today)
+    today_rows = daily_stats[daily_stats["Date"] == today]
+    today_stats = today_rows.iloc[0] if not today_rows.empty else None
+    pdv_today = today_stats is not None and pd.notna(today_stats["calories_eaten"])
+    daily_stats["Date"] = pd.to_datetime(daily_stats["Date"])
     
     # Progress bars for PDV variables
     pdv_max_values = {
@@ -80,24 +112,12 @@ def show():
         
         # Loop through all PDV variables
         for pdv_variable, max_value in pdv_max_values.items():
-            # Map PDV variable to its index
-            idx_map = {
-                "total_fat_PDV": 0,
-                "sugar_PDV": 1,
-                "sodium_PDV": 2,
-                "protein_PDV": 3,
-                "saturated_fat_PDV": 4,
-                "carbohydrates_PDV": 5,
-            }
-            idx = idx_map.get(pdv_variable, None)
-
-            # Calculate the total value for the PDV variable today
-            if idx is not None:
-                total_pdv_value = sum([entry[idx] for entry in pdv_today])
-
-                # Add data to lists for Plotly bar chart
-                bar_data.append(total_pdv_value)
-                bar_labels.append(pdv_variable.replace('_', ' ').title())
+            # Total value of the PDV variable today (summed in the daily summary)
+            total_pdv_value = today_stats[pdv_variable]
+
+            # Add data to lists for Plotly bar chart
+            bar_data.append(total_pdv_value)
+            bar_labels.append(pdv_variable.replace('_', ' ').title())
         col1, col2 = st.columns(2)
         with col1:
             # Create the Plotly horizontal bar chart
@@ -137,14 +157,8 @@ def show():
         with col2:
             
 
-            # Prepare a DataFrame for PDV data
-            pdv_df = pd.DataFrame(pdv_data, columns=[
-                'total_fat_PDV', 'sugar_PDV', 'sodium_PDV', 'protein_PDV', 
-                'saturated_fat_PDV', 'carbohydrates_PDV', 'some_other_variable', 'Date'
-            ])
-
-            # Convert the "Date" column to datetime format
-            pdv_df['Date'] = pd.to_datetime(pdv_df['Date'])
+            # PDV summed per day, for the days with food entries
+            pdv_df = daily_stats[daily_stats['calories_eaten'].notna()]
 
             # Check that we have data
             if not pdv_df.empty:
@@ -178,9 +192,8 @@ def show():
                 st.plotly_chart(fig4)               
 
 
-    # Get today's activities and calories burned
-    today_activities = [activity for activity in activity_data if activity[1].startswith(today)]
-    total_calories_today = sum([activity[2] for activity in today_activities]) if today_activities else 0
+    # Get today's calories burned
+    total_calories_today = today_stats["calories_burned"] if today_stats is not None and pd.notna(today_stats["calories_burned"]) else 0
 
     # Calories burned today graph using Plotly
     #st.write("**Calories burned today**")
@@ -190,21 +203,12 @@ def show():
 
     col1, col2 = st.columns(2)
     with col1:
-        # Récupération des activités
-        username = st.session_state["user"]
-        activity_data = get_activities(username)
-
-        # Convertir les données en DataFrame
-        df_activities = pd.DataFrame(activity_data, columns=["Activity", "Start Time", "Calories", "BMR Calories", "Steps"])
-        df_activities["Start Time"] = pd.to_datetime(df_activities["Start Time"], errors='coerce')
+        # Calories brûlées par jour (synthèse journalière)
+        daily_calories = daily_stats[daily_stats["calories_burned"].notna()].rename(columns={"calories_burned": "Calories"})
 
-        if df_activities.empty:
+        if daily_calories.empty:
             st.write("No activity data available.")
         else:
-            # Grouper les calories brûlées par jour
-            df_activities["Date"] = df_activities["Start Time"].dt.date
-            daily_calories = df_activities.groupby("Date")["Calories"].sum().reset_index()
-
             # Création du graphique avec Plotly
             fig1 = go.Figure()
             fig1.add_trace(go.Scatter(
@@ -225,7 +229,7 @@ def show():
             ))
 
             fig1.update_layout(
-                title="Calories Burned Since the Beginning",
+                title="Calories Burned per Day",
                 xaxis_title="Date",
                 yaxis_title="Calories Burned",
                 xaxis=dict(tickformat="%Y-%m-%d"),
@@ -239,8 +243,7 @@ def show():
         
         # Weight and BMI data visualization using Plotly
         height_m = user_info[5] / 100  # Assuming height is at index 5 in user tuple, convert cm to meters
-        df_weight = pd.DataFrame(weight_data, columns=["Weight", "Date"])
-        df_weight["Date"] = pd.to_datetime(df_weight["Date"])
+        df_weight = daily_stats[daily_stats["weight"].notna()].rename(columns={"weight": "Weight"})
         df_weight["BMI"] = df_weight["Weight"] / (height_m ** 2)
             
         fig2 = go.Figure()
@@ -274,30 +277,18 @@ def show():
 
         st.plotly_chart(fig2)
 
-    # Récupération des activités
-    username = st.session_state["user"]
-    activity_data = get_activities(username)
-
-    # Convertir les données en DataFrame
-    df_activities = pd.DataFrame(activity_data, columns=["Activity", "Start Time", "Calories", "BMR Calories", "Steps"])
-    df_activities["Start Time"] = pd.to_datetime(df_activities["Start Time"], errors='coerce')
-
-    # Filtrer les activités depuis le début
-    df_last_month = df_activities
-
-    # Compter la fréquence des types d'activités
-    activity_counts = df_last_month["Activity"].value_counts().reset_index()
-    activity_counts.columns = ["Activity", "Count"]
+    # Compter la fréquence des types d'activités sur la période affichée
+    activity_counts = pd.DataFrame(snapshot["activity_counts"], columns=["Activity", "Count"])
 
     # Créer le pie chart avec Plotly
-    fig = px.pie(activity_counts, values="Count", names="Activity", title="Breakdown of Activities Over the Past Month")
+    fig = px.pie(activity_counts, values="Count", names="Activity", title="Breakdown of Activities Over the Period")
 
     # Mettre le texte au centre et ajuster la légende en bas
     fig.update_traces(textinfo='percent+label', textposition='inside')
 
     # Ajuster la légende
     fig.update_layout(
-        title="Breakdown of Activities Over the Past Month",
+        title="Breakdown of Activities Over the Period",
         title_x=0.44,  # Centre le titre
         legend=dict(
             orientation="h",  # Légende horizontale
@@ -3,7 +3,9 @@ import streamlit as st
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from helpers.database import get_user, update_user_info, add_poids, add_activity, get_garmin_id
+from helpers.database import get_user, update_user_info, add_poids, get_garmin_id
+from helpers.sync_scheduler import get_sync_status, request_sync
+from helpers.garmin_backfill import get_backfill_progress, start_backfill
 
 def show():
     st.title("📝 Personal Information")
@@ -28,15 +30,32 @@ def show():
         if not garmin_id or not garmin_password:
             st.error("❌ Garmin ID or password not found")
         else:
-            update = add_activity(user_id, garmin_id, garmin_password)
-            try:
-                if update:
-                    st.write("✅ Data updated successfully!")
-                else:
-                    st.write(f"❌ An error occurred with the API")
-            except Exception as e:
-                st.write(f"❌ An error occurred with the API")
-            
+            # The sync runs in the background scheduler: the page does not wait for Garmin
+            request_sync(user_id)
+            st.write("✅ Sync requested, your activities will be updated in a few moments.")
+
+    sync_status = get_sync_status(user_id)
+    if sync_status and sync_status["status"] == "running":
+        st.caption("🔄 Garmin sync in progress...")
+    elif sync_status and sync_status["status"] == "error":
+        st.caption(f"❌ Last Garmin sync failed ({sync_status['last_error']}), next attempt at {sync_status['next_sync_at']}")
+    elif sync_status and sync_status["last_synced_at"]:
+        st.caption(f"Last Garmin sync: {sync_status['last_synced_at']}")
+
+    # Import of the whole Garmin history, in the background
+    backfill = get_backfill_progress(user_id)
+    if garmin_id and garmin_password:
+        if backfill and backfill["done"] < backfill["ranges"]:
+            st.progress(backfill["done"] / backfill["ranges"],
+                        text=f"Importing your Garmin history: {backfill['activities']} activities so far")
+            if backfill["failed"] and not backfill["running"] and st.button("Retry the import of your Garmin history"):
+                start_backfill(user_id, garmin_id, garmin_password)
+                st.rerun()
+        elif backfill:
+            st.caption(f"Garmin history imported ({backfill['activities']} activities)")
+        elif st.button("Import your Garmin history"):
+            start_backfill(user_id, garmin_id, garmin_password)
+            st.rerun()
 
     st.subheader("Your details")
     
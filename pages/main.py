@@ -1,15 +1,19 @@
 import streamlit as st
 st.set_page_config(layout="wide")
-import pandas as pd
 import sys
 import os
-import chat, informations, activite, alimentation, visu, dashboard
+import importlib
+from datetime import date
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from streamlit_option_menu import option_menu
 from helpers.database import init_db, register_user, get_user, verify_password,add_poids
+from helpers.sync_scheduler import start_scheduler
+from helpers.garmin_backfill import start_backfill
 
 # Initialisation de la base de données SQLite
 init_db()
+# Synchronisation Garmin en arrière-plan (démarrée une seule fois par processus)
+start_scheduler()
 
 def login():
     """Affichage du formulaire de connexion"""
@@ -40,7 +44,7 @@ def register():
         with col1:
             new_password = st.text_input("Choose a password *", type="password", key="register_pass") 
             height = st.number_input("Height (cm) *", min_value=0, max_value=300, step=1, key="register_height", value=175)  # Default average height for men
-            birth_date = st.date_input("Date of Birth *", value=pd.to_datetime("2001-06-08"), key="register_birthdate")
+            birth_date = st.date_input("Date of Birth *", value=date(2001, 6, 8), key="register_birthdate")
         with col2:
             confirm_password = st.text_input("Confirm password *", type="password", key="register_confirm")
             weight = st.number_input("Weight (kg) *", min_value=0, max_value=300, step=1, key="register_weight", value=70)  # Default average weight for men
@@ -66,6 +70,8 @@ def register():
                     if user:  # Vérifier que l'utilisateur a bien été ajouté
                         user_id = user[0]  # Supposons que l'ID utilisateur est stocké en première colonne de la table
                         add_poids(user_id, weight)  # Ajout des informations du poids
+                        if garmin_id and garmin_password:
+                            start_backfill(user_id, garmin_id, garmin_password)  # Import de l'historique Garmin en arrière-plan
                     st.session_state["authenticated"] = True
                     st.session_state["user"] = new_username
                     st.session_state["success_message"] = "✅ Account successfully created"
@@ -73,6 +79,11 @@ def register():
                 else:
                     st.error("❌ Username already taken")
 
+def show_page(module_name):
+    """Imports a page module only when it is opened, so that the login screen
+    does not wait for the heavy dependencies (YOLO, recipe catalog, OpenAI...)."""
+    importlib.import_module(module_name).show()
+
 def logout():
     st.session_state.clear()
     st.rerun()
@@ -102,14 +113,13 @@ if st.session_state["authenticated"]:
             logout()
 
     if page == "Dashboard":
-        dashboard.show()
+        show_page("dashboard")
     elif page == "Alimentation":
-        alimentation.show()
+        show_page("alimentation")
     elif page == "Personal Information":
-        informations.show()
+        show_page("informations")
     elif page == "Coach":
-        import chat
-        chat.show()
+        show_page("chat")
 else:
     st.markdown("""
         <style>
@@ -1,13 +1,14 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
-
-DB_FILE = "data/users.db"
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from helpers.database import get_connection
 
 def show():
     st.title("📊 View Database")
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     
     # Affichage des utilisateurs
     st.subheader("Users")
@@ -29,7 +30,5 @@ def show():
     pdv_data = pd.read_sql_query("SELECT * FROM pdv", conn)
     st.dataframe(pdv_data)
 
-    conn.close()
-
 if __name__ == "__main__":
     show()
\ No newline at end of file
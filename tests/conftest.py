@@ -0,0 +1,35 @@
+import importlib
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """helpers.database on a fresh, migrated database in a temporary folder."""
+    pytest.importorskip("bcrypt")
+    from helpers import database
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "users.db"))
+    database.init_db()
+    yield database
+    database.close_connection()
+
+@pytest.fixture
+def user_id(db):
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+        return cursor.lastrowid
+
+@pytest.fixture
+def load_recipe_recommandation(monkeypatch):
+    """Imports helpers.recipe_recommandation on a stub catalog (DataFrame) instead of the real one."""
+    from helpers import recipe_catalog
+
+    def load(catalog):
+        monkeypatch.setattr(recipe_catalog, "load_catalog", lambda: catalog)
+        sys.modules.pop("helpers.recipe_recommandation", None)
+        return importlib.import_module("helpers.recipe_recommandation")
+
+    yield load
+    sys.modules.pop("helpers.recipe_recommandation", None)
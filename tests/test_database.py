@@ -0,0 +1,174 @@
+import threading
+
+import pytest
+
+def run_in_thread(target):
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+
+def test_connection_of_an_ended_thread_is_reused(db):
+    connections = []
+    for _ in range(5):
+        run_in_thread(lambda: connections.append(db.get_connection()))
+    assert len({id(conn) for conn in connections}) == 1
+
+def test_idle_connections_are_bounded(db):
+    barrier = threading.Barrier(db.POOL_SIZE + 4)
+
+    def use_connection():
+        db.query("SELECT 1")
+        barrier.wait()
+
+    threads = [threading.Thread(target=use_connection) for _ in range(db.POOL_SIZE + 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(db._pool) == db.POOL_SIZE
+
+def test_thread_ending_in_a_transaction_releases_the_write_lock(db):
+    run_in_thread(lambda: db.get_connection().execute("BEGIN IMMEDIATE"))
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    assert db.query("SELECT COUNT(*) FROM users") == [(1,)]
+
+def query_plans(db, call):
+    """Runs call() and returns {SQL statement: EXPLAIN QUERY PLAN details} of the statements it executed."""
+    statements = []
+    conn = db.get_connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    return {sql: " / ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+            for sql in statements if sql.lstrip().upper().startswith(("SELECT", "INSERT", "WITH"))}
+
+def plan_of(plans, table):
+    """Plan of the only statement reading `table`."""
+    matching = [plan for plan in plans.values() if f" {table} " in plan + " "]
+    assert len(matching) == 1, plans
+    return matching[0]
+
+@pytest.mark.parametrize("call, table, index", [
+    (lambda db, user_id: db.get_calories(user_id), "activities", "INDEX idx_activities_user_start_date"),
+    # Every activity of the user: either (user_id, ...) index does
+    (lambda db, user_id: db.get_activities("alice"), "activities", "INDEX idx_activities_user_"),
+    (lambda db, user_id: db.get_activity_counts(user_id, "2024-01-01"), "activities", "INDEX idx_activities_user_start_time"),
+    (lambda db, user_id: db.get_poids(user_id), "poids", "INDEX idx_poids_user_date"),
+    (lambda db, user_id: db.get_pdv(user_id), "pdv", "INDEX idx_pdv_user_date"),
+    # Dashboard: the daily rollup is read by its (user_id, day) primary key
+    (lambda db, user_id: db.get_daily_stats(user_id, "2024-01-01"), "daily_user_stats", "PRIMARY KEY"),
+    (lambda db, user_id: db.get_last_weight(user_id), "daily_user_stats", "PRIMARY KEY"),
+])
+def test_per_user_queries_use_the_indexes(db, user_id, call, table, index):
+    plan = plan_of(query_plans(db, lambda: call(db, user_id)), table)
+    assert f"SEARCH {table} USING {index}" in plan, plan
+
+def test_daily_stats_refresh_uses_the_indexes(db, user_id):
+    plans = query_plans(db, lambda: db.add_poids(user_id, 70.0))
+    refresh = next(plan for sql, plan in plans.items() if "daily_user_stats" in sql and "INSERT" in sql.upper())
+    for table, index in [("activities", "idx_activities_user_start_date"), ("pdv", "idx_pdv_user_date"),
+                         ("poids", "idx_poids_user_date")]:
+        assert f"SEARCH {table} USING INDEX {index}" in refresh, refresh
+        assert f"SCAN {table}" not in refresh, refresh
+
+def test_snapshot_written_during_its_read_is_stale(db, user_id, monkeypatch):
+    get_user = db.get_user
+
+    def get_user_then_write(username):
+        # Another session records a weight once the read snapshot has started
+        user = get_user(username)
+        run_in_thread(lambda: db.add_poids(user_id, 70.0))
+        return user
+
+    monkeypatch.setattr(db, "get_user", get_user_then_write)
+    snapshot = db.get_dashboard_snapshot("alice")
+    assert snapshot["last_weight"] is None
+    assert snapshot["version"] != db.get_data_version(user_id)
+
+def activity(activity_id, start_time, calories, steps):
+    return {"id": activity_id, "activity_name": "running", "start_time": start_time,
+            "calories": calories, "bmrCalories": 50, "steps": steps}
+
+def daily_stats(db, user_id):
+    """{day: {column: value}} of the user's daily rollup rows."""
+    return {row[0]: dict(zip(db.DAILY_STATS_COLUMNS, row[1:])) for row in db.get_daily_stats(user_id)}
+
+@pytest.fixture
+def on_day(db, monkeypatch):
+    """on_day("YYYY-MM-DD") makes the write functions record their entries on that day."""
+    real_date = db.date
+
+    def set_day(day):
+        class FixedDate(real_date):
+            @classmethod
+            def today(cls):
+                return real_date.fromisoformat(day)
+        monkeypatch.setattr(db, "date", FixedDate)
+    return set_day
+
+def test_pdv_entries_of_a_day_are_summed(db, user_id, on_day):
+    on_day("2024-01-01")
+    db.add_pdv(user_id, 500, total_fat_PDV=10, sugar_PDV=20, protein_PDV=5)
+    db.add_pdv(user_id, 300, total_fat_PDV=15, sugar_PDV=None, protein_PDV=7, sodium_PDV=3)
+    stats = daily_stats(db, user_id)["2024-01-01"]
+    assert (stats["calories_eaten"], stats["total_fat_PDV"], stats["sugar_PDV"], stats["protein_PDV"],
+            stats["sodium_PDV"], stats["saturated_fat_PDV"]) == (800, 25, 20, 12, 3, None)
+
+def test_last_weight_of_the_day_is_kept(db, user_id, on_day):
+    on_day("2024-01-01")
+    db.add_poids(user_id, 80.0)
+    on_day("2024-01-02")
+    db.add_poids(user_id, 79.5)
+    db.add_poids(user_id, 79.0)
+    stats = daily_stats(db, user_id)
+    assert (stats["2024-01-01"]["weight"], stats["2024-01-02"]["weight"]) == (80.0, 79.0)
+    assert db.get_last_weight(user_id) == 79.0
+
+def test_moved_activity_updates_both_days(db, user_id):
+    db.upsert_activities(user_id, [activity(1, "2024-01-01 08:00:00", 300, 4000),
+                                   activity(2, "2024-01-01 18:00:00", 200, 1000),
+                                   activity(3, "2024-01-02 08:00:00", 100, 500)])
+    stats = daily_stats(db, user_id)
+    assert (stats["2024-01-01"]["calories_burned"], stats["2024-01-01"]["steps"]) == (500, 5000)
+    assert (stats["2024-01-02"]["calories_burned"], stats["2024-01-02"]["steps"]) == (100, 500)
+
+    # Activity 2 edited on Garmin: moved to the next day
+    db.upsert_activities(user_id, [activity(2, "2024-01-02 18:00:00", 200, 1000)])
+    stats = daily_stats(db, user_id)
+    assert (stats["2024-01-01"]["calories_burned"], stats["2024-01-01"]["steps"]) == (300, 4000)
+    assert (stats["2024-01-02"]["calories_burned"], stats["2024-01-02"]["steps"]) == (300, 1500)
+
+    # Activity 1 moved too: its former day has no data left, so no row
+    db.upsert_activities(user_id, [activity(1, "2024-01-03 08:00:00", 300, 4000)])
+    stats = daily_stats(db, user_id)
+    assert list(stats) == ["2024-01-02", "2024-01-03"]
+
+def test_migration_fill_matches_the_incremental_rollup(db, user_id, on_day):
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO users (username, password_hash) VALUES ('bob', 'x')")
+        other_user = cursor.lastrowid
+    for uid in (user_id, other_user):
+        db.upsert_activities(uid, [activity(10 * uid + 1, "2024-01-01 08:00:00", 300, 4000),
+                                   activity(10 * uid + 2, "2024-01-03 08:00:00", 250, None)])
+        on_day("2024-01-01")
+        db.add_pdv(uid, 500, total_fat_PDV=10)
+        db.add_poids(uid, 80.0 + uid)
+        on_day("2024-01-02")
+        db.add_pdv(uid, 700, sugar_PDV=30, carbohydrates_PDV=12)
+        db.add_pdv(uid, 100)
+        on_day("2024-01-04")
+        db.add_poids(uid, 79.0 + uid)
+        db.add_poids(uid, 78.0 + uid)
+        # Moved activity: its former day has no data left
+        db.upsert_activities(uid, [activity(10 * uid + 2, "2024-01-05 08:00:00", 250, 3000)])
+    incremental = db.query("SELECT * FROM daily_user_stats ORDER BY user_id, day")
+    assert len(incremental) == 2 * 4
+
+    # Migration 6 on the same data
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM daily_user_stats")
+        db._fill_daily_stats(cursor)
+    assert db.query("SELECT * FROM daily_user_stats ORDER BY user_id, day") == incremental
@@ -0,0 +1,125 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+# helpers.garmin_backfill imports helpers.database
+pytest.importorskip("bcrypt")
+
+TODAY = date(2024, 3, 31)
+
+def garmin_activity(activity_id, day):
+    return {"activityId": activity_id, "activityName": "cycling", "startTimeLocal": f"{day} 08:00:00",
+            "calories": 500, "bmrCalories": 60, "steps": None}
+
+class StubClient:
+    """Logged-in Garmin client stand-in: serves `activities` by date range and page, fails the ranges starting in `failing`."""
+    garmin_connect_activities = "/activitylist-service/activities/search/activities"
+
+    def __init__(self, activities, failing=()):
+        self.activities = activities
+        self.failing = set(failing)
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def connectapi(self, url, params):
+        assert url == self.garmin_connect_activities
+        with self._lock:
+            self.requests.append(params)
+        if params["startDate"] in self.failing:
+            raise RuntimeError("Garmin Connect unavailable")
+        in_range = [activity for activity in self.activities
+                    if params["startDate"] <= activity["startTimeLocal"][:10] <= params["endDate"]]
+        start, limit = int(params["start"]), int(params["limit"])
+        return in_range[start:start + limit]
+
+    def ranges(self):
+        return sorted({(params["startDate"], params["endDate"]) for params in self.requests}, reverse=True)
+
+class CountingLimiter:
+    def __init__(self):
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self._lock:
+            self.tokens += tokens
+
+@pytest.fixture
+def garmin_backfill(db, monkeypatch):
+    from helpers import garmin_backfill
+    monkeypatch.setattr(garmin_backfill, "garmin_rate_limiter", CountingLimiter())
+    return garmin_backfill
+
+def daily_activities(first_day, days):
+    return [garmin_activity(100 + i, (first_day + timedelta(days=i)).isoformat()) for i in range(days)]
+
+def planned_ranges(db, user_id):
+    return db.query("""
+    SELECT range_start, range_end, status FROM garmin_backfill WHERE user_id = ? ORDER BY range_start DESC
+    """, (user_id,))
+
+def test_date_ranges_cover_the_period_most_recent_first():
+    from helpers.garmin_backfill import date_ranges
+    assert date_ranges(date(2024, 1, 1), date(2024, 1, 10), days=4) == [
+        ("2024-01-07", "2024-01-10"), ("2024-01-03", "2024-01-06"), ("2024-01-01", "2024-01-02")]
+    # A period of a whole number of ranges, a single day, an empty period
+    assert date_ranges(date(2024, 1, 1), date(2024, 1, 8), days=4) == [
+        ("2024-01-05", "2024-01-08"), ("2024-01-01", "2024-01-04")]
+    assert date_ranges(date(2024, 1, 1), date(2024, 1, 1), days=4) == [("2024-01-01", "2024-01-01")]
+    assert date_ranges(date(2024, 1, 2), date(2024, 1, 1), days=4) == []
+
+def test_planning_again_only_extends_from_the_last_range(garmin_backfill, db, user_id):
+    assert garmin_backfill.plan_backfill(user_id, years=1, range_days=30, today=TODAY) == 13
+    ranges = planned_ranges(db, user_id)
+    assert ranges[0] == ("2024-03-02", "2024-03-31", "pending")
+    assert ranges[-1][0] == (TODAY - timedelta(days=365)).isoformat()
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE garmin_backfill SET status = 'done' WHERE user_id = ? AND range_start = '2024-03-02'", (user_id,))
+
+    # The same day: nothing to add
+    assert garmin_backfill.plan_backfill(user_id, years=1, range_days=30, today=TODAY) == 0
+    # 10 days later: one range from the day after the last planned one, the others keep their status
+    assert garmin_backfill.plan_backfill(user_id, years=1, range_days=30, today=TODAY + timedelta(days=10)) == 1
+    assert planned_ranges(db, user_id) == [("2024-04-01", "2024-04-10", "pending"),
+                                           ("2024-03-02", "2024-03-31", "done")] + ranges[1:]
+
+def test_failed_range_does_not_block_the_others(garmin_backfill, db, user_id):
+    # 4 ranges of 100 days (the last one 66 days), one activity per day
+    assert garmin_backfill.plan_backfill(user_id, years=1, range_days=100, today=TODAY) == 4
+    client = StubClient(daily_activities(TODAY - timedelta(days=365), 366), failing={"2023-09-14"})
+    progress = garmin_backfill.run_backfill(user_id, "alice@example.com", "secret", client=client)
+    assert progress == {"ranges": 4, "done": 3, "failed": 1, "activities": 266, "running": False}
+    assert [status for _, _, status in planned_ranges(db, user_id)] == ["done", "error", "done", "done"]
+    assert db.query("SELECT error FROM garmin_backfill WHERE status = 'error'") == [("Garmin Connect unavailable",)]
+    assert db.query("SELECT COUNT(*) FROM activities WHERE user_id = ?", (user_id,)) == [(266,)]
+    # One request per page: a range of 100 activities needs a second (empty) page to end
+    assert garmin_backfill.garmin_rate_limiter.tokens == len(client.requests) == 2 + 1 + 2 + 1
+
+def test_run_again_only_fetches_the_ranges_not_done(garmin_backfill, db, user_id):
+    garmin_backfill.plan_backfill(user_id, years=1, range_days=100, today=TODAY)
+    activities = daily_activities(TODAY - timedelta(days=365), 366)
+    garmin_backfill.run_backfill(user_id, "alice@example.com", "secret", client=StubClient(activities, failing={"2023-09-14"}))
+
+    # The failed range is fetched again, the ranges done are not
+    client = StubClient(activities)
+    progress = garmin_backfill.run_backfill(user_id, "alice@example.com", "secret", client=client)
+    assert client.ranges() == [("2023-09-14", "2023-12-22")]
+    assert progress == {"ranges": 4, "done": 4, "failed": 0, "activities": 366, "running": False}
+    assert db.query("SELECT COUNT(*) FROM activities WHERE user_id = ?", (user_id,)) == [(366,)]
+
+    # Everything done: no request (and no login)
+    client = StubClient(activities)
+    garmin_backfill.run_backfill(user_id, "alice@example.com", "secret", client=client)
+    assert client.requests == []
+
+def test_progress_counts(garmin_backfill, user_id):
+    assert garmin_backfill.get_backfill_progress(user_id) is None
+    garmin_backfill.plan_backfill(user_id, years=1, range_days=100, today=TODAY)
+    assert garmin_backfill.get_backfill_progress(user_id) == {
+        "ranges": 4, "done": 0, "failed": 0, "activities": 0, "running": False}
+    garmin_backfill._running.add(user_id)
+    try:
+        assert garmin_backfill.get_backfill_progress(user_id)["running"]
+    finally:
+        garmin_backfill._running.discard(user_id)
@@ -0,0 +1,258 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+# helpers.garmin_sync imports helpers.database
+pytest.importorskip("bcrypt")
+garth = pytest.importorskip("garth")
+pytest.importorskip("garminconnect")
+from garth.exc import GarthHTTPError
+
+PASSWORD = "secret"
+
+def garmin_activity(activity_id, start_time):
+    return {"activityId": activity_id, "activityName": "running", "startTimeLocal": start_time,
+            "calories": 300, "bmrCalories": 50, "steps": 4000}
+
+def activity_history(count, first_day=1):
+    """`count` activities, one per day from 2024-01-<first_day>, newest first like Garmin Connect."""
+    return [garmin_activity(1000 + i, f"2024-{1 + i // 28:02d}-{1 + i % 28:02d} 08:00:00")
+            for i in reversed(range(first_day - 1, first_day - 1 + count))]
+
+class StubGarminConnect(BaseHTTPRequestHandler):
+    """
+    Garmin SSO and Connect API stand-in, requests are routed by subdomain (/sso/..., /connectapi/...).
+    Serves the SSO login for PASSWORD, the OAuth1 -> OAuth2 exchange, the profile and `history` by pages.
+    Only the access tokens in `access_tokens` are accepted (empty it to revoke the sessions).
+    """
+    history = []
+    requests = []
+    access_tokens = set()
+    issued = 0
+    fail_activities = False
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def route(self, method):
+        url = urlsplit(self.path)
+        subdomain, path = url.path.split("/", 2)[1:]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append((method, subdomain, "/" + path, params))
+        if subdomain == "sso":
+            return self.sso(method, "/" + path)
+        if path.startswith("oauth-service/oauth/preauthorized"):
+            return self.reply("oauth_token=oauth1&oauth_token_secret=oauth1-secret", "text/plain")
+        if path.startswith("oauth-service/oauth/exchange"):
+            StubGarminConnect.issued += 1
+            # About the size of a Garmin JWT: Garmin.login(tokens) reads shorter token strings as a directory
+            access_token = f"access-{self.issued}." + "x" * 1000
+            self.access_tokens.add(access_token)
+            return self.reply(json.dumps({
+                "scope": "CONNECT_READ", "jti": access_token, "token_type": "Bearer",
+                "access_token": access_token, "refresh_token": "refresh",
+                "expires_in": 3600, "refresh_token_expires_in": 7200,
+            }))
+        if self.headers.get("Authorization", "").removeprefix("Bearer ") not in self.access_tokens:
+            return self.reply("", status=401)
+        if path == "userprofile-service/socialProfile":
+            return self.reply(json.dumps({"displayName": "alice", "fullName": "Alice", "userName": "alice"}))
+        if path == "userprofile-service/userprofile/user-settings":
+            return self.reply(json.dumps({"userData": {"measurementSystem": "metric"}}))
+        if path == "activitylist-service/activities/search/activities":
+            if self.fail_activities:
+                return self.reply("", status=400)
+            start, limit = int(params["start"]), int(params["limit"])
+            return self.reply(json.dumps(self.history[start:start + limit]))
+        self.reply("", status=404)
+
+    def sso(self, method, path):
+        if path == "/sso/embed":
+            return self.reply("<html></html>", "text/html")
+        if method == "GET":
+            return self.reply('<title>Sign In</title><input name="_csrf" value="csrf">', "text/html")
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        if form["password"] != [PASSWORD]:
+            return self.reply("<title>Error</title>", "text/html")
+        self.reply('<title>Success</title><a href="embed?ticket=ST-1">', "text/html")
+
+    def reply(self, body, content_type="application/json", status=200):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+    @classmethod
+    def full_logins(cls):
+        return sum(1 for method, subdomain, path, _ in cls.requests if (method, subdomain, path) == ("POST", "sso", "/sso/signin"))
+
+    @classmethod
+    def pages(cls):
+        return [int(params["start"]) for _, _, path, params in cls.requests if path.endswith("/search/activities")]
+
+class CountingLimiter:
+    def __init__(self):
+        self.tokens = 0
+
+    def acquire(self, tokens=1):
+        self.tokens += tokens
+
+@pytest.fixture
+def garmin_sync(db, monkeypatch):
+    """
+    helpers.garmin_sync with the real garminconnect/garth clients, whose https://<subdomain>.garmin.com
+    requests are sent to a local StubGarminConnect, with an empty client cache and a counting rate limiter.
+    """
+    from helpers import garmin_sync
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGarminConnect)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    class LocalAdapter(garth.http.HTTPAdapter):
+        def send(self, request, **kwargs):
+            url = urlsplit(request.url)
+            subdomain = url.hostname.split(".", 1)[0]
+            request.url = f"http://127.0.0.1:{server.server_port}/{subdomain}{url.path}" + (f"?{url.query}" if url.query else "")
+            return super().send(request, **kwargs)
+
+    # garth mounts its adapter on every (re)configuration, its OAuth1 sessions reuse it
+    monkeypatch.setattr(garth.http, "HTTPAdapter", LocalAdapter)
+    monkeypatch.setattr(garth.sso, "OAUTH_CONSUMER", {"consumer_key": "key", "consumer_secret": "secret"})
+    monkeypatch.setattr(garmin_sync, "_clients", {})
+    monkeypatch.setattr(garmin_sync, "garmin_rate_limiter", CountingLimiter())
+    StubGarminConnect.history = activity_history(5)
+    StubGarminConnect.requests = []
+    StubGarminConnect.access_tokens = set()
+    StubGarminConnect.issued = 0
+    StubGarminConnect.fail_activities = False
+    yield garmin_sync
+    server.shutdown()
+    server.server_close()
+
+def test_first_sync_logs_in_and_stores_the_session(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.full_logins() == 1
+    tokens = garmin_sync.get_sync_state(user_id)[0]
+    # The garth session (OAuth1 and OAuth2 tokens), as loaded back by Garmin.login(tokens)
+    client = garth.Client()
+    client.loads(tokens)
+    assert client.oauth1_token.oauth_token == "oauth1"
+    assert client.oauth2_token.access_token in StubGarminConnect.access_tokens
+
+def test_cached_client_is_reused_without_login(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    client = garmin_sync._clients[user_id]
+    StubGarminConnect.requests = []
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert garmin_sync._clients[user_id] is client
+    # Only the activity page, no login nor profile
+    assert [path for _, _, path, _ in StubGarminConnect.requests] == ["/activitylist-service/activities/search/activities"]
+
+def test_stored_session_is_reused_by_a_new_process(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    tokens = garmin_sync.get_sync_state(user_id)[0]
+    garmin_sync._clients.clear()
+    StubGarminConnect.requests = []
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.full_logins() == 0
+    assert ("GET", "connectapi", "/userprofile-service/socialProfile", {}) in StubGarminConnect.requests
+    assert garmin_sync.get_sync_state(user_id)[0] == tokens
+
+def test_invalid_session_falls_back_to_a_full_login(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    tokens = garmin_sync.get_sync_state(user_id)[0]
+    garmin_sync._clients.clear()
+    StubGarminConnect.access_tokens.clear()
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.full_logins() == 2
+    new_tokens = garmin_sync.get_sync_state(user_id)[0]
+    assert new_tokens != tokens
+    client = garth.Client()
+    client.loads(new_tokens)
+    assert client.oauth2_token.access_token in StubGarminConnect.access_tokens
+
+def test_refreshed_session_is_stored(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    client = garth.Client()
+    client.loads(garmin_sync.get_sync_state(user_id)[0])
+    client.oauth2_token.expires_at = 0
+    garmin_sync.save_tokens(user_id, client.dumps())
+    garmin_sync._clients.clear()
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    # garth exchanged the OAuth1 token for a new OAuth2 token, without a full login
+    assert StubGarminConnect.full_logins() == 1
+    client.loads(garmin_sync.get_sync_state(user_id)[0])
+    assert client.oauth2_token.access_token.startswith("access-2.")
+    assert not client.oauth2_token.expired
+
+def test_failed_sync_drops_the_cached_client(garmin_sync, user_id):
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    StubGarminConnect.fail_activities = True
+    with pytest.raises(GarthHTTPError):
+        garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert user_id not in garmin_sync._clients
+
+def test_sync_fetches_pages_down_to_the_watermark(garmin_sync, user_id):
+    # Without a watermark only the most recent page is fetched
+    StubGarminConnect.history = activity_history(45)
+    counts = garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.pages() == [0]
+    assert counts["inserted"] == garmin_sync.PAGE_SIZE
+    watermark = garmin_sync.get_sync_state(user_id)[1]
+    assert watermark == StubGarminConnect.history[0]["startTimeLocal"]
+
+    # 25 new activities: pages are fetched until one reaches the watermark
+    StubGarminConnect.history = activity_history(25, first_day=46) + StubGarminConnect.history
+    StubGarminConnect.requests = []
+    counts = garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.pages() == [0, garmin_sync.PAGE_SIZE]
+    # The activity at the watermark is fetched again, unchanged
+    assert counts == {"inserted": 25, "updated": 0, "skipped": 1}
+    assert garmin_sync.get_sync_state(user_id)[1] == StubGarminConnect.history[0]["startTimeLocal"]
+
+    # Nothing new: one page, nothing written, the watermark stays
+    StubGarminConnect.requests = []
+    counts = garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    assert StubGarminConnect.pages() == [0]
+    assert counts["inserted"] == counts["updated"] == 0
+
+def test_requests_go_through_the_rate_limiter(garmin_sync, user_id):
+    StubGarminConnect.history = activity_history(30)
+    garmin_sync.sync_user(user_id, "alice@example.com", PASSWORD)
+    # The login, then one page (no watermark yet)
+    assert garmin_sync.garmin_rate_limiter.tokens == garmin_sync.LOGIN_REQUESTS + 1
+
+def test_rate_limiter_allows_a_burst_then_the_rate():
+    from helpers.garmin_sync import RateLimiter
+    limiter = RateLimiter(rate=20, burst=4)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - start >= 4 / 20 - 0.01
+
+def test_rate_limiter_is_shared_by_threads():
+    from helpers.garmin_sync import RateLimiter
+    limiter = RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [limiter.acquire() for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 20 requests, 1 without waiting, the others at 50 per second
+    assert time.monotonic() - start >= 19 / 50 - 0.01
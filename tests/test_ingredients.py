@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+import pytest
+
+from helpers.ingredients import aligned_partial_ratio, ingredients_categories, match_categories, normalize_ingredient
+
+COUNTS_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "ingredient_counts.txt")
+
+@pytest.mark.parametrize("ingredient, category", [
+    ("butter", "butter"),
+    ("eggs", "eggs"),
+    ("chicken breasts", "chicken"),
+    ("condensed cream of mushroom soup", "mushrooms"),
+    # rapidfuzz's partial_ratio alone matched these on short windows at the start of the string
+    ("beer", None),
+    ("dried cranberries", None),
+    ("coriander", None),
+    ("yeast", None),
+    ("eggplant", None),
+    ("cooked bacon", None),
+    ("", None),
+])
+def test_known_ingredients(ingredient, category):
+    assert match_categories([ingredient])[0] == [category]
+
+def first_version_category(ingredient):
+    """The per-string rule of the first version, with fuzzywuzzy."""
+    from fuzzywuzzy import fuzz
+    ingredient = ingredient.lower()
+    for category in ingredients_categories:
+        if fuzz.partial_ratio(ingredient, category.lower()) > 80:
+            return category
+    return None
+
+@pytest.mark.skipif(not os.path.exists(COUNTS_FILE), reason="data/ingredient_counts.txt not found")
+@pytest.mark.parametrize("as_in_csv", [True, False], ids=["as in the csv", "without quotes"])
+def test_same_categories_as_the_first_version(as_in_csv):
+    pytest.importorskip("fuzzywuzzy")
+    ingredients = [normalize_ingredient(str(ingredient)) for ingredient in pd.read_csv(COUNTS_FILE).iloc[:, 0]]
+    if not as_in_csv:
+        ingredients = [ingredient.strip("'[] ") for ingredient in ingredients]
+    categories, _ = match_categories(ingredients)
+    different = [(ingredient, category) for ingredient, category in zip(ingredients, categories)
+                 if category != first_version_category(ingredient)]
+    assert different == []
+
+def test_aligned_score_never_exceeds_the_prefilter_score():
+    from rapidfuzz import fuzz
+    for ingredient in ["beer", "coriander", "'strawberry jam'", "ham", "a", "sweet potatoes", "x" * 250 + "milk"]:
+        for category in ingredients_categories:
+            assert aligned_partial_ratio(ingredient, category) <= fuzz.partial_ratio(ingredient, category) + 0.5
+
+def test_streaming_passes_are_sized_by_the_memory_budget(tmp_path, monkeypatch):
+    from helpers import chunked_pipeline, ingredients
+    rows = pd.DataFrame({"id": range(500), "ingredients": ["['butter', 'beer', 'salt']", "['eggs', 'corn']"] * 250})
+    rows.to_csv(tmp_path / "recipes.csv", index=False)
+    read_chunks = []
+    read_csv = pd.read_csv
+
+    def recording_read_csv(*args, **kwargs):
+        read_chunks.append(kwargs.get("chunksize"))
+        return read_csv(*args, **kwargs)
+
+    monkeypatch.setattr(ingredients.pd, "read_csv", recording_read_csv)
+    monkeypatch.setattr(chunked_pipeline.pd, "read_csv", recording_read_csv)
+    written = ingredients.process_ingredients(str(tmp_path / "recipes.csv"), str(tmp_path / "out.csv"),
+                                              str(tmp_path / "mapping.json"), stream=True, max_memory_mb=1, workers=1)
+    assert written == 500
+    # Both passes read chunks sized from the 1 MB budget, not a fixed number of rows
+    expected = chunked_pipeline.estimate_chunksize(str(tmp_path / "recipes.csv"), 1, 1)
+    assert [chunksize for chunksize in read_chunks if chunksize] == [expected, expected]
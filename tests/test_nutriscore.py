@@ -0,0 +1,78 @@
+import filecmp
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import nutriscore
+
+def around(thresholds):
+    """Values on, just below and just above each threshold, plus both ends of the scale."""
+    return sorted({0.0, thresholds[-1] * 2} | {value for t in thresholds for value in (t - 0.01, t, t + 0.01)})
+
+def test_vectorized_scores_match_the_row_wise_rule_at_every_threshold():
+    rng = random.Random(0)
+    candidates = [around(nutriscore.energy_thresholds), around(nutriscore.sugars_thresholds),
+                  around(nutriscore.satfat_thresholds), around(nutriscore.sodium_thresholds),
+                  around(nutriscore.protein_thresholds)]
+    rows = [[rng.choice(values) for values in candidates] for _ in range(5000)]
+    # Each threshold of each nutrient at least once, the others at 0
+    for i, values in enumerate(candidates):
+        rows += [[value if j == i else 0.0 for j in range(5)] for value in values]
+    # Missing values in each position
+    rows += [[np.nan if j == i else 1.0 for j in range(5)] for i in range(5)]
+
+    scores, grades = nutriscore.calculate_nutriscores(*np.array(rows).T)
+    for row, score, grade in zip(rows, scores, grades):
+        expected_score, expected_grade = nutriscore.calculate_nutriscore(*row)
+        if expected_score is None:
+            assert np.isnan(score) and grade is None, row
+        else:
+            assert (score, grade) == (expected_score, expected_grade), row
+
+@pytest.mark.parametrize("nutrition", [
+    "[51.5, 0.0, 13.0, 0.0, 2.0, 0.0, 4.0]",
+    "[ 51.5,0.0 , 13.0, 0.0, 2.0, 0.0, 4.0 ]",
+    "[51.5, 0.0, 13.0, 0.0, 2.0, 0.0, 4.0, 99.0]",
+    "[51.5, 0.0, 13.0]",
+    "[]",
+    "not a list",
+    "[51.5, 0.0, 13.0, 0.0, 2.0, 0.0, nan_value]",
+    np.nan,
+])
+def test_bulk_parser_matches_extract_nutrition(nutrition):
+    # Alone, and among valid rows (the bulk parser splits the whole column at once)
+    for column in ([nutrition], [nutrition, "[1, 2, 3, 4, 5, 6, 7]"]):
+        parsed = nutriscore.parse_nutrition(pd.Series(column, dtype=object))
+        for value, (_, row) in zip(column, parsed.iterrows()):
+            expected = nutriscore.extract_nutrition(value)
+            if expected is None:
+                assert row.isna().all(), value
+            else:
+                assert row.to_dict() == expected, value
+
+def write_raw_recipes(path, n_rows=1000):
+    rng = random.Random(1)
+    rows = []
+    for i in range(n_rows):
+        values = [round(rng.uniform(0, 800), 1)] + [rng.randint(0, 60) for _ in range(6)]
+        rows.append({
+            "name": f"recipe {i}",
+            # Duplicated ids and scores so that the sort has ties to break
+            "id": rng.randint(1, n_rows // 2),
+            "minutes": 10,
+            "nutrition": str(values) if i % 37 else "[broken",
+            "ingredients": "['apple', 'butter']",
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+def test_streaming_output_is_byte_identical_to_the_in_memory_output(tmp_path):
+    raw = str(tmp_path / "RAW_recipes.csv")
+    write_raw_recipes(raw)
+    in_memory, streamed = str(tmp_path / "in_memory.csv"), str(tmp_path / "streamed.csv")
+
+    assert nutriscore.process_recipes(raw, in_memory) == 1000
+    # 1 MB gives the smallest chunks (100 rows): 10 sorted runs to merge
+    assert nutriscore.process_recipes(raw, streamed, stream=True, max_memory_mb=1, workers=2) == 1000
+    assert filecmp.cmp(in_memory, streamed, shallow=False)
@@ -0,0 +1,103 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+# Recipes of the stub catalog: 1 and 2 have an image, 3 has none (404), 4 answers slowly
+CATALOG = pd.DataFrame({
+    "id": [1, 2, 3, 4],
+    "name": ["apple pie", "banana bread", "lost recipe", "slow soup"],
+    "ingredient_mask": [0b111, 0b1011, 0b10011, 0b100011],
+    "grade": ["A", "B", "C", "D"],
+    "calories": [300.0, 400.0, 500.0, 600.0],
+    "nutriscore": [1, 2, 3, 4],
+})
+SLOW_SECONDS = 1.5
+
+class StubFoodCom(BaseHTTPRequestHandler):
+    """Food.com stand-in: /recipe/<name>-<id> with a primary image, 404 for recipe 3."""
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        recipe_id = int(self.path.rsplit("-", 1)[1])
+        if recipe_id == 3:
+            self.send_response(404)
+            self.end_headers()
+            return
+        if recipe_id == 4:
+            time.sleep(SLOW_SECONDS)
+        body = f'<div class="primary-image"><img src="http://img/{recipe_id}.jpg"></div>'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def recipes(tmp_path, monkeypatch, load_recipe_recommandation):
+    """recipe_recommandation on the stub catalog, resolving images from a local server into a temporary cache."""
+    # The image cache lives in data/ under the working directory
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    module = load_recipe_recommandation(CATALOG)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFoodCom)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    StubFoodCom.requests = []
+    monkeypatch.setattr(module, "RECIPE_BASE_URL", f"http://127.0.0.1:{server.server_port}/recipe/")
+    yield module
+    server.shutdown()
+    server.server_close()
+
+def test_fetches_uncached_images_then_serves_them_from_the_cache(recipes):
+    assert recipes.get_food_image_urls([1, 2], deadline=5) == {1: "http://img/1.jpg", 2: "http://img/2.jpg"}
+    assert len(StubFoodCom.requests) == 2
+
+    assert recipes.get_food_image_urls([2, 1], deadline=5) == {2: "http://img/2.jpg", 1: "http://img/1.jpg"}
+    assert len(StubFoodCom.requests) == 2
+
+def test_recipe_without_image_is_cached_as_a_miss(recipes):
+    assert recipes.get_food_image_urls([3], deadline=5) == {3: None}
+    assert recipes.get_food_image_urls([3], deadline=5) == {3: None}
+    assert recipes.get_food_image_url(3) is None
+    assert StubFoodCom.requests == ["/recipe/lost-recipe-3"]
+
+def test_unknown_recipe_is_not_requested(recipes):
+    assert recipes.get_food_image_urls([99], deadline=5) == {99: None}
+    assert StubFoodCom.requests == []
+
+def test_deadline_returns_resolved_urls_and_slow_ones_fill_the_cache(recipes):
+    start = time.perf_counter()
+    image_urls = recipes.get_food_image_urls([1, 4], deadline=0.5)
+    assert time.perf_counter() - start < SLOW_SECONDS
+    assert image_urls == {1: "http://img/1.jpg", 4: None}
+
+    # The request still running after the deadline stores its result in the cache
+    time.sleep(SLOW_SECONDS + 0.5)
+    assert recipes.get_food_image_urls([4], deadline=0.5) == {4: "http://img/4.jpg"}
+    assert StubFoodCom.requests.count("/recipe/slow-soup-4") == 1
+
+def test_warm_resolves_the_likely_recipes_concurrently(recipes):
+    start = time.perf_counter()
+    assert recipes.warm_image_cache(4) == 3
+    # The slow recipe is fetched alongside the others, not after them
+    assert time.perf_counter() - start < 2 * SLOW_SECONDS
+    assert sorted(StubFoodCom.requests) == ["/recipe/apple-pie-1", "/recipe/banana-bread-2",
+                                            "/recipe/lost-recipe-3", "/recipe/slow-soup-4"]
+
+def test_purge_removes_only_expired_entries(tmp_path):
+    from helpers import image_cache
+    cache_file = str(tmp_path / "images.db")
+    now = 1_000_000_000
+    image_cache.set_cached_image_urls({1: "http://img/1.jpg", 2: None}, cache_file, now=now)
+    image_cache.set_cached_image_urls({3: "http://img/3.jpg", 4: None}, cache_file,
+                                      now=now - image_cache.NEGATIVE_TTL_SECONDS - 1)
+    assert image_cache.purge_expired(cache_file, now=now) == 1
+    assert image_cache.get_cached_image_urls([1, 2, 3, 4], cache_file, now=now) == {1: "http://img/1.jpg", 2: None, 3: "http://img/3.jpg"}
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers.recipe_catalog import INGREDIENT_CATEGORIES, build_ingredient_masks
+
+def bit(category):
+    return 1 << INGREDIENT_CATEGORIES.index(category)
+
+@pytest.mark.parametrize("ingredients, present, absent", [
+    ("['cornstarch', 'water']", [], ["corn"]),
+    ("['corn kernels', 'butter']", ["corn", "butter"], []),
+    ("['2 Tomatoes', 'onions']", ["tomato", "onion"], []),
+    ("['buttermilk', 'hamburger buns']", [], ["butter", "milk", "ham", "bread"]),
+    ("['goat cheese', 'chicken breasts']", ["goat_cheese", "cheese", "chicken_breast", "chicken"], []),
+])
+def test_masks_match_whole_words(ingredients, present, absent):
+    mask = int(build_ingredient_masks(pd.Series([ingredients]))[0])
+    assert all(mask & bit(category) for category in present)
+    assert not any(mask & bit(category) for category in absent)
+
+def stub_catalog(recipes):
+    """Catalog rows from (ingredient categories, grade, calories), ids in catalog order."""
+    return pd.DataFrame({
+        "id": np.arange(len(recipes)),
+        "name": [f"recipe {i}" for i in range(len(recipes))],
+        "ingredient_mask": [sum(bit(category) for category in categories) for categories, _, _ in recipes],
+        "grade": [grade for _, grade, _ in recipes],
+        "calories": [calories for _, _, calories in recipes],
+        "nutriscore": np.zeros(len(recipes)),
+    })
+
+FRIDGE = ["apple", "banana", "butter", "eggs", "flour"]
+
+def test_more_matches_rank_first(load_recipe_recommandation):
+    recipes = load_recipe_recommandation(stub_catalog([
+        (["apple", "banana", "butter"], "A", 300),
+        (["apple", "banana", "butter", "eggs", "flour"], "E", 300),
+        (["apple", "banana", "butter", "eggs"], "C", 300),
+    ]))
+    assert list(recipes.recommend_recipes(FRIDGE)["id"]) == [1, 2, 0]
+
+def test_recipe_mostly_covered_by_the_fridge_ranks_first(load_recipe_recommandation):
+    recipes = load_recipe_recommandation(stub_catalog([
+        (["apple", "banana", "butter", "sugar", "milk", "ham"], "B", 300),
+        (["apple", "banana", "butter"], "B", 300),
+    ]))
+    top = recipes.recommend_recipes(FRIDGE)
+    assert list(top["id"]) == [1, 0]
+    assert list(top["match_count"]) == [3, 3]
+
+def test_grade_and_calories_break_equal_matches(load_recipe_recommandation):
+    recipes = load_recipe_recommandation(stub_catalog([
+        (["apple", "banana", "butter"], "D", 300),
+        (["apple", "banana", "butter"], "A", 500),
+        (["apple", "banana", "butter"], "A", 300),
+    ]))
+    assert list(recipes.recommend_recipes(FRIDGE, remaining_calories=400)["id"]) == [2, 1, 0]
+
+def test_ties_at_the_cut_keep_catalog_order(load_recipe_recommandation):
+    same = (["apple", "banana", "butter"], "B", 300)
+    best = (["apple", "banana", "butter", "eggs"], "B", 300)
+    recipes = load_recipe_recommandation(stub_catalog([same] * 150 + [best] + [same] * 150))
+    assert list(recipes.recommend_recipes(FRIDGE, k=10)["id"]) == [150] + list(range(9))
+
+def test_recipes_below_min_matches_or_unknown_ingredients_are_not_returned(load_recipe_recommandation):
+    recipes = load_recipe_recommandation(stub_catalog([
+        (["apple", "banana"], "A", 300),
+        (["apple", "banana", "butter"], "A", 300),
+    ]))
+    assert list(recipes.recommend_recipes(FRIDGE)["id"]) == [1]
+    assert recipes.recommend_recipes(["caviar"]).empty